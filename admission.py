@@ -0,0 +1,224 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+
+import metrics
+
+# (priority, methods or None for any, path prefixes), first match wins, unmatched requests get DEFAULT_PRIORITY.
+# Priority 0 is never queued nor refused: the probes must answer while the worker is saturated.
+# Priority 1 is for cheap single-document reads only; listings, search and /api/runnable (an outbound
+# HTTP call) are the expensive API requests and get DEFAULT_PRIORITY.
+PRIORITIES = [
+    (0, None, ('/isready', '/isReady', '/IsReady', '/isalive', '/isAlive', '/IsAlive', '/metrics')),
+    (1, ('GET', 'HEAD'), ('/api/quiz/', '/api/question/', '/api/stats/quiz/')),
+    (2, ('POST',), ('/quiz', '/api/grade/')),
+]
+DEFAULT_PRIORITY = 3
+
+# share of the wait queue each priority may fill, lower priorities are refused first
+QUEUE_SHARES = {1: 1.0, 2: 0.75, 3: 0.5}
+
+
+def classify(method, path):
+    """
+    Priority of a request, see PRIORITIES
+
+    :param method: e.g. 'GET'
+    :type method: str
+    :param path: e.g. '/api/quiz/3021178c-c430-4285-bed2-114dfe4db9df'
+    :type path: str
+
+    :rtype: int
+    :return: 0 (health) to DEFAULT_PRIORITY
+    """
+    for _priority, _methods, _prefixes in PRIORITIES:
+        if (_methods is None or method in _methods) and path.startswith(_prefixes):
+            return _priority
+    return DEFAULT_PRIORITY
+
+
+class AdmissionController:
+    """
+    Per-worker concurrency limit with a bounded, prioritized wait queue
+
+    At most 'limit' requests run at once; others wait, highest priority (lowest number) first, up to
+    'timeout' seconds, in a queue of at most 'queue_size' (QUEUE_SHARES of it for lower priorities).
+    Anything beyond is refused at once, so the caller can answer 503 instead of adding latency.
+    """
+
+    def __init__(self, limit, queue_size, timeout=1.0, ready_hold=2.0):
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.ready_hold = ready_hold
+        self._active = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._refused_at = None
+        self.admitted = 0
+        self.refused = 0
+
+    def acquire(self, priority):
+        """
+        Wait for a slot
+
+        :param priority: 1 (first) to DEFAULT_PRIORITY, see classify()
+        :type priority: int
+
+        :rtype: Boolean
+        :return: True when admitted, release() must follow; False when refused
+        """
+        _start = time.monotonic()
+        with self._condition:
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                self.admitted += 1
+                return True
+
+            if len(self._waiting) >= int(self.queue_size * QUEUE_SHARES.get(priority, 0.5)):
+                return self._refuse(priority, _start, 'full')
+
+            _entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, _entry)
+            _deadline = _start + self.timeout
+            while not (self._waiting[0] == _entry and self._active < self.limit):
+                _remaining = _deadline - time.monotonic()
+                if _remaining <= 0:
+                    self._waiting.remove(_entry)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                    return self._refuse(priority, _start, 'timeout')
+                self._condition.wait(_remaining)
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self.admitted += 1
+            # the next waiter may also fit
+            self._condition.notify_all()
+        metrics.ADMISSION_WAIT.labels(priority, 'admitted').observe(time.monotonic() - _start)
+        return True
+
+    def try_acquire(self):
+        """
+        A slot if one is free and nobody waits, without waiting, see acquire()
+
+        :rtype: Boolean
+        :return: True when admitted, release() must follow
+        """
+        with self._condition:
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                self.admitted += 1
+                return True
+            return False
+
+    def _refuse(self, priority, start, reason):
+        """Count a refusal, caller holds the lock"""
+        self.refused += 1
+        self._refused_at = time.monotonic()
+        metrics.ADMISSION_WAIT.labels(priority, reason).observe(self._refused_at - start)
+        return False
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def saturated(self):
+        """
+        True while the wait queue is at least half full, or for 'ready_hold' seconds after a refusal
+
+        :rtype: Boolean
+        """
+        with self._condition:
+            if self.queue_size and len(self._waiting) >= max(1, self.queue_size // 2):
+                return True
+            return self._refused_at is not None and time.monotonic() - self._refused_at < self.ready_hold
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: {'limit': ..., 'active': ..., 'waiting': ..., 'queue_size': ..., 'admitted': ..., 'refused': ...}
+        """
+        with self._condition:
+            return {'limit': self.limit, 'active': self._active, 'waiting': len(self._waiting),
+                    'queue_size': self.queue_size, 'admitted': self.admitted, 'refused': self.refused}
+
+
+def busy_body(priority):
+    """
+    JSON body of the 503 answered to a refused request
+
+    :rtype: bytes
+    """
+    return json.dumps({'message': 'server busy', 'code': 503, 'value': priority}).encode()
+
+
+class _Slot:
+    """Response body iterator freeing the request slot once, when it is exhausted or closed"""
+
+    def __init__(self, iterable, release):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._free()
+            raise
+
+    def _free(self):
+        if self._release is not None:
+            _release, self._release = self._release, None
+            _release()
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._free()
+
+
+class AdmissionMiddleware:
+    """
+    WSGI middleware answering '503 Service Unavailable' with Retry-After to requests the controller refuses
+
+    The slot is held until the response body is exhausted or closed, streamed responses included.
+
+    :param app: WSGI application, e.g. application.wsgi_app
+    :param controller: AdmissionController
+    :param retry_after: seconds sent in Retry-After
+    :type retry_after: int
+    """
+
+    def __init__(self, app, controller, retry_after=1):
+        self.app = app
+        self.controller = controller
+        self.retry_after = retry_after
+
+    def __call__(self, environ, start_response):
+        _priority = classify(environ.get('REQUEST_METHOD', 'GET'), environ.get('PATH_INFO', ''))
+        if _priority == 0:
+            return self.app(environ, start_response)
+
+        if not self.controller.acquire(_priority):
+            _body = busy_body(_priority)
+            start_response('503 SERVICE UNAVAILABLE', [('Content-Type', 'application/json'),
+                                                        ('Content-Length', str(len(_body))),
+                                                        ('Retry-After', str(self.retry_after))])
+            return [_body]
+
+        try:
+            return _Slot(self.app(environ, start_response), self.controller.release)
+        except BaseException:
+            self.controller.release()
+            raise
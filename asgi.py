@@ -0,0 +1,296 @@
+"""
+Optional asynchronous serving mode: the routes of wsgi.py on an ASGI server
+
+    $ gunicorn -c config.py -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8080 asgi:application
+    $ uvicorn --workers 3 --port 8080 asgi:application
+
+The MongoDB and upstream bound GET routes of VIEWS run as coroutines on the event loop, so a worker
+is no longer limited to 'threads' concurrent requests while they wait on I/O. They call the same
+helpers as the wsgi.py views and share the quiz cache of wsgi.py; MongoDB is read with an
+asynchronous client (see database.get_async_client()), the two reads of a /quiz page at once.
+
+Each coroutine view runs in a Flask request context of wsgi.application, matched by its URL map,
+with its before/after request hooks (metrics, session, assets), so URLs, templates, headers and
+errors are those of the WSGI application. Every other request is passed to the WSGI application
+in a thread (asgiref WsgiToAsgi), below its admission middleware. At most ASGI_ADMISSION_LIMIT
+requests, coroutine views and WSGI requests alike, run at once per worker, others wait or get 503
+as with admission.py.
+"""
+import asyncio
+import inspect
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Response
+from flask import jsonify
+from flask import request
+from markupsafe import escape
+
+import admission
+import database
+import wsgi
+from outbound import UpstreamError
+from wsgi import json_body
+
+# Flask endpoint -> coroutine called with the view arguments, GET requests only
+VIEWS = {}
+
+# admission control of every request, as admission.AdmissionMiddleware does for wsgi.application
+_admission = admission.AdmissionController(wsgi.application.config["ASGI_ADMISSION_LIMIT"],
+                                           wsgi.application.config["ADMISSION_QUEUE"],
+                                           wsgi.application.config["ADMISSION_TIMEOUT"],
+                                           ready_hold=wsgi.application.config["ADMISSION_RETRY_AFTER"])
+
+
+def view(endpoint):
+    """Register a coroutine as the asynchronous version of a wsgi.py view"""
+    def _register(function):
+        VIEWS[endpoint] = function
+        return function
+    return _register
+
+
+async def admit(priority):
+    """
+    AdmissionController.acquire() without blocking the event loop, only a request that has to wait takes a thread
+
+    :rtype: Boolean
+    :return: True when admitted, _admission.release() must follow
+    """
+    return _admission.try_acquire() or await asyncio.to_thread(_admission.acquire, priority)
+
+
+def async_db():
+    """
+    :return: database of the asynchronous client, or the snapshot (whose methods answer at once)
+    """
+    return database.get_async_db(maxPoolSize=wsgi.application.config["ASGI_MONGO_POOL_SIZE"])
+
+
+async def find_one(collection, query, projection=None):
+    """
+    find_one() on the asynchronous client, or on the snapshot
+
+    :param collection: collection name, e.g. 'quiz_stats'
+    :type collection: str
+
+    :rtype: dict
+    :return: document or None
+    """
+    _result = async_db()[collection].find_one(query, projection)
+    return await _result if inspect.isawaitable(_result) else _result
+
+
+async def json_document(collection, query, projection):
+    """
+    Asynchronous wsgi.json_document(): body and ETag from the quiz cache, a miss read with the asynchronous client
+
+    :param collection: collection of wsgi.question_document() or wsgi.quiz_document(), only its name is used
+    """
+    return wsgi.document_response(*await wsgi._cache.find_one_json_async(async_db()[collection.name], query,
+                                                                         projection, json_body))
+
+
+async def load_quiz_page(qzid):
+    """
+    Asynchronous wsgi.load_quiz_page(): on a cache miss both documents are read at once
+    """
+    _quizzes = async_db().quizzes
+    _data, _meta = wsgi.quiz_page_queries(qzid)
+    (_quiz, _version), _meta_data = await asyncio.gather(wsgi._cache.find_one_async(_quizzes, *_data, revision=True),
+                                                         wsgi._cache.find_one_async(_quizzes, *_meta))
+    return _quiz, _meta_data, _version
+
+
+@view('nouns_quiz')
+async def nouns_quiz():
+    _request_values_id = wsgi.quiz_page_id()
+    return wsgi.quiz_page(_request_values_id, *await load_quiz_page(_request_values_id))
+
+
+@view('get_quid_json')
+async def get_quid_json(quid):
+    _quid = escape(quid)
+    return wsgi.invalid_id(_quid, 'question_id') or await json_document(*wsgi.question_document(_quid))
+
+
+@view('get_qzid_json')
+async def get_qzid_json(quiz_id):
+    _quiz_id = escape(quiz_id)
+    return wsgi.invalid_id(_quiz_id, 'quiz_id') or await json_document(*wsgi.quiz_document(_quiz_id))
+
+
+@view('get_qzid_stats_json')
+async def get_qzid_stats_json(quiz_id):
+    _quiz_id = escape(quiz_id)
+    _invalid = wsgi.invalid_id(_quiz_id, 'quiz_id')
+    if _invalid:
+        return _invalid
+
+    # not cached, read with the asynchronous client
+    return wsgi.quiz_stats_response(_quiz_id, await find_one('quiz_stats', *wsgi.quiz_stats_query(_quiz_id)))
+
+
+@view('runnable')
+async def runnable():
+    # the pooled, cached outbound client with its circuit breaker, in a thread: the event loop keeps serving
+    try:
+        _response = await asyncio.to_thread(wsgi._outbound.get_json, wsgi.application.config["RUNNABLE_URL"])
+    except UpstreamError as _error:
+        _json_error = {'message': 'upstream unavailable', 'code': 503, 'value': str(_error)}
+        return jsonify(_json_error), 503
+
+    return jsonify(_response.data), _response.status, {'X-Cache': _response.source}
+
+
+@view('is_ready')
+async def is_ready():
+    if _admission.saturated():
+        return 'notReady', 503, {'Retry-After': str(wsgi.application.config["ADMISSION_RETRY_AFTER"])}
+    return wsgi.is_ready()
+
+
+@view('is_alive')
+async def is_alive():
+    return wsgi.is_alive()
+
+
+def environ(scope):
+    """
+    WSGI environ of an ASGI HTTP request without a body, for Flask's request context
+
+    :param scope: ASGI connection scope, type 'http'
+    :type scope: dict
+
+    :rtype: dict
+    """
+    _server = scope.get('server') or ('localhost', 80)
+    _environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': _server[0],
+        'SERVER_PORT': str(_server[1] if _server[1] is not None else 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for _name, _value in scope.get('headers', []):
+        _name = _name.decode('latin-1').upper().replace('-', '_')
+        _value = _value.decode('latin-1')
+        if _name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            _name = 'HTTP_' + _name
+        _environ[_name] = _environ[_name] + ',' + _value if _name in _environ else _value
+    return _environ
+
+
+class AsyncApplication:
+    """
+    ASGI application: coroutine VIEWS in a request context of app, everything else through fallback,
+    both admitted by _admission
+
+    :param app: Flask application, wsgi.application
+    :param fallback: ASGI application for the other requests, without admission control of its own,
+        e.g. WsgiToAsgi(wsgi._compression)
+    """
+
+    def __init__(self, app, fallback):
+        self.app = app
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await self.fallback(scope, receive, send)
+
+        _priority = admission.classify(scope['method'], scope['path'])
+        if _priority != 0 and not await admit(_priority):
+            _response = Response(admission.busy_body(_priority), status=503, mimetype='application/json',
+                                 headers={'Retry-After': str(self.app.config["ADMISSION_RETRY_AFTER"])})
+            return await self._send(send, _response)
+
+        try:
+            await self._handle(scope, receive, send)
+        finally:
+            # released here, asgiref never closes a WSGI response body, see admission._Slot
+            if _priority != 0:
+                _admission.release()
+
+    async def _handle(self, scope, receive, send):
+        """A coroutine view of a GET request, or the fallback"""
+        if scope['method'] != 'GET':
+            return await self.fallback(scope, receive, send)
+
+        _context = self.app.request_context(environ(scope))
+        _context.push()
+        _view = VIEWS.get(request.url_rule.endpoint) if request.url_rule is not None else None
+        if _view is None:
+            _context.pop()
+            return await self.fallback(scope, receive, send)
+
+        _error = None
+        try:
+            # the compression of wsgi.application.wsgi_app, which these responses do not go through
+            await self._send(send, wsgi._compression.compress_response(await self._dispatch(_view), request.environ))
+        except Exception as _exception:
+            _error = _exception
+            raise
+        finally:
+            _context.pop(_error)
+
+    async def _dispatch(self, coroutine):
+        """Flask's full_dispatch_request() around an awaited view"""
+        try:
+            try:
+                _rv = self.app.preprocess_request()
+                if _rv is None:
+                    _rv = await coroutine(**request.view_args)
+            except Exception as _exception:
+                _rv = self.app.handle_user_exception(_exception)
+            return self.app.finalize_request(_rv)
+        except Exception as _exception:
+            return self.app.handle_exception(_exception)
+
+    @staticmethod
+    async def _send(send, response):
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': [(_name.lower().encode('latin-1'), _value.encode('latin-1'))
+                                for _name, _value in response.headers.to_wsgi_list()]})
+        try:
+            for _chunk in response.iter_encoded():
+                await send({'type': 'http.response.body', 'body': _chunk, 'more_body': True})
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            _message = await receive()
+            if _message['type'] == 'lifespan.startup':
+                if not await asyncio.to_thread(database.warm_up):
+                    wsgi.application.logger.warning('MongoDB not reachable at startup, connecting on first request')
+                if not await database.warm_up_async(maxPoolSize=wsgi.application.config["ASGI_MONGO_POOL_SIZE"]):
+                    wsgi.application.logger.warning('MongoDB not reachable by the asynchronous client at startup')
+                await send({'type': 'lifespan.startup.complete'})
+            elif _message['type'] == 'lifespan.shutdown':
+                # as config.worker_exit does for gunicorn workers
+                if not await asyncio.to_thread(wsgi._results.close):
+                    wsgi.application.logger.warning('quiz results not flushed at shutdown')
+                await database.close_async()
+                database.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+# wsgi._compression: wsgi.application.wsgi_app without its AdmissionMiddleware, _admission applies instead
+application = AsyncApplication(wsgi.application, WsgiToAsgi(wsgi._compression))
@@ -0,0 +1,286 @@
+"""
+Fingerprinted, precompressed static assets and an SVG sprite of the bootstrap icons
+
+    $ python assets.py build                 # static/dist/ and static/dist/manifest.json
+    $ python assets.py build --all-icons     # sprite with every bootstrap icon, not only those in templates/
+    $ python assets.py clean
+
+'build' copies each static file to static/dist/<name>.<hash><ext>, adds .gz and, when Brotli is
+installed, .br variants of text assets, and writes a sprite of the icons used by the templates.
+init_app() loads the manifest: url_for('static', filename='bootstrap.min.css') then points at the
+fingerprinted copy, served with 'Cache-Control: immutable' and the best Content-Encoding the client
+accepts. Without a manifest the static files are served as before.
+
+The Dockerfile runs 'build' in the image, gunicorn runs it in the master when ASSETS_BUILD=1, see config.py.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from flask import request
+from flask import send_from_directory
+from flask import url_for
+from markupsafe import Markup
+from markupsafe import escape
+
+STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+ICONS = 'bootstrap-icons'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.json', '.txt', '.map')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Icons referenced by templates, as a static file or through icon()
+_ICON_REFERENCE = re.compile(r"bootstrap-icons/([\w-]+)\.svg|icon\(\s*'([\w-]+)'")
+_SVG = re.compile(r'<svg\b([^>]*)>(.*)</svg>', re.DOTALL)
+_VIEW_BOX = re.compile(r'viewBox="([^"]+)"')
+
+
+def _brotli():
+    """Brotli module if installed (Brotli or brotlicffi), else None"""
+    for _name in ('brotli', 'brotlicffi'):
+        try:
+            return __import__(_name)
+        except ImportError:
+            pass
+    return None
+
+
+def available_encodings():
+    """
+    Content-Encodings build() can precompress with, best first
+
+    :rtype: list
+    :return: e.g. ['br', 'gzip']
+    """
+    return (['br'] if _brotli() is not None else []) + ['gzip']
+
+
+def fingerprint(data):
+    """
+    Content hash used in fingerprinted file names
+
+    :param data: file content
+    :type data: bytes
+
+    :rtype: str
+    :return: 16 hex digits, e.g. '3f2a9c0d41be77e5'
+    """
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return _brotli().compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _write(static_dir, filename, data):
+    """
+    Write dist/<name>.<hash><ext> and its precompressed variants, those not smaller than data are skipped
+
+    :rtype: tuple
+    :return: (fingerprinted filename relative to static_dir, list of encodings written)
+    """
+    _stem, _ext = os.path.splitext(filename)
+    _hashed = '/'.join([DIST, '{0}.{1}{2}'.format(_stem, fingerprint(data), _ext)])
+    _path = os.path.join(static_dir, *_hashed.split('/'))
+    os.makedirs(os.path.dirname(_path), exist_ok=True)
+    with open(_path, 'wb') as _file:
+        _file.write(data)
+
+    _encodings = []
+    if _ext.lower() in COMPRESSIBLE:
+        for _encoding in available_encodings():
+            _compressed = _compress(data, _encoding)
+            if len(_compressed) < len(data):
+                with open(_path + ('.br' if _encoding == 'br' else '.gz'), 'wb') as _file:
+                    _file.write(_compressed)
+                _encodings.append(_encoding)
+    return _hashed, _encodings
+
+
+def used_icons(templates_dir=TEMPLATES):
+    """
+    Bootstrap icons referenced by the templates
+
+    :rtype: list
+    :return: sorted icon names, e.g. ['check2-circle', 'circle', 'circle-fill']
+    """
+    _names = set()
+    for _root, _dirs, _files in os.walk(templates_dir):
+        for _name in _files:
+            with open(os.path.join(_root, _name), encoding='utf-8') as _file:
+                for _match in _ICON_REFERENCE.finditer(_file.read()):
+                    _names.add(_match.group(1) or _match.group(2))
+    return sorted(_names)
+
+
+def build_sprite(icon_dir, names):
+    """
+    SVG sprite with one <symbol id="name"> per icon, for <svg><use href="sprite.svg#name"/></svg>
+
+    :param icon_dir: directory of the icon files, e.g. static/bootstrap-icons
+    :type icon_dir: str
+    :param names: icon names, e.g. ['check2-circle', 'circle']
+    :type names: list
+
+    :rtype: tuple
+    :return: (sprite as bytes, names of the icons in it)
+    """
+    _symbols = []
+    _included = []
+    for _name in names:
+        _path = os.path.join(icon_dir, _name + '.svg')
+        if not os.path.isfile(_path):
+            continue
+        with open(_path, encoding='utf-8') as _file:
+            _match = _SVG.search(_file.read())
+        if _match is None:
+            continue
+        _view_box = _VIEW_BOX.search(_match.group(1))
+        _symbols.append('<symbol id="{0}" viewBox="{1}">{2}</symbol>'.format(
+            _name, _view_box.group(1) if _view_box else '0 0 16 16', _match.group(2).strip()))
+        _included.append(_name)
+
+    _sprite = '<svg xmlns="http://www.w3.org/2000/svg" style="display:none">\n{0}\n</svg>\n'.format(
+        '\n'.join(_symbols))
+    return _sprite.encode('utf-8'), _included
+
+
+def build(static_dir=STATIC, templates_dir=TEMPLATES, all_icons=False):
+    """
+    (Re)create static_dir/dist with fingerprinted, precompressed copies of all static files and the manifest
+
+    :param static_dir: Flask static folder
+    :type static_dir: str
+    :param templates_dir: scanned for the icons to put in the sprite
+    :type templates_dir: str
+    :param all_icons: sprite with every icon in static_dir/bootstrap-icons
+    :type all_icons: Boolean
+
+    :rtype: dict
+    :return: manifest, {'assets': {'bootstrap.min.css': 'dist/bootstrap.min.<hash>.css', ...},
+             'encodings': {'dist/bootstrap.min.<hash>.css': ['br', 'gzip'], ...},
+             'sprite': {'file': 'dist/bootstrap-icons.<hash>.svg', 'icons': [...]} or None}
+    """
+    _dist = os.path.join(static_dir, DIST)
+    shutil.rmtree(_dist, ignore_errors=True)
+
+    _manifest = {'assets': {}, 'encodings': {}, 'sprite': None}
+    for _root, _dirs, _files in os.walk(static_dir):
+        _dirs[:] = sorted(_dir for _dir in _dirs if os.path.join(_root, _dir) != _dist)
+        for _name in sorted(_files):
+            _filename = os.path.relpath(os.path.join(_root, _name), static_dir).replace(os.sep, '/')
+            with open(os.path.join(_root, _name), 'rb') as _file:
+                _hashed, _encodings = _write(static_dir, _filename, _file.read())
+            _manifest['assets'][_filename] = _hashed
+            _manifest['encodings'][_hashed] = _encodings
+
+    _icon_dir = os.path.join(static_dir, ICONS)
+    if os.path.isdir(_icon_dir):
+        _names = sorted(_x[:-4] for _x in os.listdir(_icon_dir) if _x.endswith('.svg')) if all_icons \
+            else used_icons(templates_dir)
+        _sprite, _included = build_sprite(_icon_dir, _names)
+        if _included:
+            _hashed, _encodings = _write(static_dir, ICONS + '.svg', _sprite)
+            _manifest['encodings'][_hashed] = _encodings
+            _manifest['sprite'] = {'file': _hashed, 'icons': _included}
+
+    with open(os.path.join(_dist, MANIFEST), 'w', encoding='utf-8') as _file:
+        json.dump(_manifest, _file, indent=2, sort_keys=True)
+    return _manifest
+
+
+def load_manifest(static_dir=STATIC):
+    """
+    :rtype: dict
+    :return: manifest written by build(), None if there is none
+    """
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST), encoding='utf-8') as _file:
+            return json.load(_file)
+    except FileNotFoundError:
+        return None
+
+
+def init_app(app):
+    """
+    Serve the built assets: manifest-aware url_for('static', ...), immutable caching and
+    precompressed Content-Encoding; register the icon() template global
+
+    :param app: Flask application, its static folder is the one build() was run on
+    """
+    _manifest = load_manifest(app.static_folder) or {'assets': {}, 'encodings': {}, 'sprite': None}
+    _assets = _manifest['assets']
+    _encodings = _manifest['encodings']
+    _sprite = _manifest['sprite']
+    _sprite_icons = frozenset(_sprite['icons']) if _sprite else frozenset()
+
+    @app.url_defaults
+    def _fingerprinted_url(endpoint, values):
+        if endpoint == 'static':
+            _hashed = _assets.get(values.get('filename'))
+            if _hashed is not None:
+                values['filename'] = _hashed
+
+    _send_static_file = app.view_functions['static']
+
+    def _send_asset(filename):
+        if filename not in _encodings:
+            return _send_static_file(filename=filename)
+
+        _encoding = next((_x for _x in _encodings[filename] if request.accept_encodings[_x]), None)
+        _suffix = {'br': '.br', 'gzip': '.gz'}.get(_encoding, '')
+        _response = send_from_directory(app.static_folder, filename + _suffix,
+                                        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if _encoding is not None:
+            _response.headers['Content-Encoding'] = _encoding
+        if _encodings[filename]:
+            _response.vary.add('Accept-Encoding')
+        _response.headers['Cache-Control'] = IMMUTABLE
+        return _response
+
+    app.view_functions['static'] = _send_asset
+
+    def icon(name, alt='', width=16, height=16):
+        """Bootstrap icon: a <use> of the sprite when built with it, else an <img> of the icon file"""
+        if name in _sprite_icons:
+            return Markup('<svg class="bi" width="{0}" height="{1}" fill="currentColor" role="img" '
+                          'aria-label="{2}"><use href="{3}#{4}"/></svg>').format(
+                width, height, alt, url_for('static', filename=_sprite['file']), name)
+        return Markup('<img src="{0}" alt="{1}" width="{2}" height="{3}">').format(
+            url_for('static', filename='{0}/{1}.svg'.format(ICONS, escape(name))), alt, width, height)
+
+    app.jinja_env.globals['icon'] = icon
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='build fingerprinted, precompressed flask-play static assets')
+    _parser.add_argument('--static', default=STATIC, help='Flask static folder')
+    _parser.add_argument('--templates', default=TEMPLATES, help='scanned for the icons used')
+    _commands = _parser.add_subparsers(dest='command', required=True)
+    _build = _commands.add_parser('build', help='(re)create static/dist and its manifest')
+    _build.add_argument('--all-icons', action='store_true', help='sprite with every bootstrap icon')
+    _commands.add_parser('clean', help='remove static/dist')
+    _args = _parser.parse_args()
+
+    if _args.command == 'clean':
+        shutil.rmtree(os.path.join(_args.static, DIST), ignore_errors=True)
+        return 0
+
+    _manifest = build(_args.static, _args.templates, _args.all_icons)
+    print(json.dumps({'assets': len(_manifest['assets']), 'encodings': available_encodings(),
+                      'sprite': _manifest['sprite']}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
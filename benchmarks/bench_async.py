@@ -0,0 +1,168 @@
+"""
+Concurrent-connection capacity of the WSGI and ASGI serving modes, see asgi.py
+
+    $ gunicorn -c config.py -b 0.0.0.0:8080 wsgi &
+    $ gunicorn -c config.py -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8081 asgi:application &
+    $ python benchmarks/bench_async.py --target wsgi=http://localhost:8080 --target asgi=http://localhost:8081
+    $ python benchmarks/bench_async.py --target asgi=http://localhost:8081 --connections 50 500 2000 --duration 20
+
+For each target and each --connections level, that many keep-alive HTTP/1.1 connections send GET
+requests back to back for --duration seconds, from one asyncio event loop (no client threads).
+Reported per level: throughput, p50/p99 latency, status codes, and errors (connection failures,
+timeouts, 5xx such as the 503 of admission.py). Quiz ids are read from the target's /api/quizzes,
+seed its database first, e.g. python seed.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import git_commit  # noqa: E402
+from bench_load import percentile  # noqa: E402
+
+
+async def read_response(reader):
+    """
+    Status and body of one HTTP/1.1 response, Content-Length or chunked
+
+    :rtype: tuple
+    :return: (status, body, keep-alive)
+    """
+    _head = await reader.readuntil(b'\r\n\r\n')
+    _lines = _head.decode('latin-1').split('\r\n')
+    _status = int(_lines[0].split(' ', 2)[1])
+    _headers = {}
+    for _line in _lines[1:]:
+        if ':' in _line:
+            _name, _value = _line.split(':', 1)
+            _headers[_name.strip().lower()] = _value.strip()
+
+    if _headers.get('transfer-encoding', '').lower() == 'chunked':
+        _chunks = []
+        while True:
+            _size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            _chunks.append(await reader.readexactly(_size + 2))
+            if _size == 0:
+                break
+        _body = b''.join(_chunk[:-2] for _chunk in _chunks)
+    else:
+        _body = await reader.readexactly(int(_headers.get('content-length', '0')))
+    return _status, _body, _headers.get('connection', '').lower() != 'close'
+
+
+async def fetch_json(url, path):
+    """GET path from url on a new connection, decoded JSON"""
+    _url = urlsplit(url)
+    _reader, _writer = await asyncio.open_connection(_url.hostname, _url.port or 80)
+    _writer.write('GET {0} HTTP/1.1\r\nHost: {1}\r\nConnection: close\r\n\r\n'.format(path, _url.netloc).encode())
+    _status, _body, _keep_alive = await read_response(_reader)
+    _writer.close()
+    if _status != 200:
+        raise RuntimeError('{0}{1}: {2}'.format(url, path, _status))
+    return json.loads(_body)
+
+
+async def run_level(url, paths, connections, duration, timeout, rng):
+    """
+    'connections' keep-alive connections sending requests for 'duration' seconds
+
+    :rtype: dict
+    :return: {'connections': ..., 'requests': ..., 'errors': ..., 'status': {...}, 'throughput_rps': ..., ...}
+    """
+    _url = urlsplit(url)
+    _latencies = []
+    _status = {}
+    _errors = [0]
+    _deadline = time.perf_counter() + duration
+
+    async def _connection():
+        _reader = _writer = None
+        while time.perf_counter() < _deadline:
+            _start = time.perf_counter()
+            try:
+                if _writer is None:
+                    _reader, _writer = await asyncio.wait_for(
+                        asyncio.open_connection(_url.hostname, _url.port or 80), timeout)
+                _writer.write('GET {0} HTTP/1.1\r\nHost: {1}\r\n\r\n'.format(rng.choice(paths), _url.netloc).encode())
+                _code, _body, _keep_alive = await asyncio.wait_for(read_response(_reader), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                _errors[0] += 1
+                if _writer is not None:
+                    _writer.close()
+                _reader = _writer = None
+                continue
+            _latencies.append(time.perf_counter() - _start)
+            _status[_code] = _status.get(_code, 0) + 1
+            if _code >= 500:
+                _errors[0] += 1
+            if not _keep_alive:
+                _writer.close()
+                _reader = _writer = None
+        if _writer is not None:
+            _writer.close()
+
+    _start = time.perf_counter()
+    await asyncio.gather(*[_connection() for _x in range(connections)])
+    _elapsed = time.perf_counter() - _start
+
+    _latencies.sort()
+    return {'connections': connections, 'requests': len(_latencies), 'errors': _errors[0],
+            'status': {str(_code): _count for _code, _count in sorted(_status.items())},
+            'throughput_rps': round(len(_latencies) / _elapsed, 1),
+            'p50_ms': round(percentile(_latencies, 0.50) * 1000, 3) if _latencies else None,
+            'p99_ms': round(percentile(_latencies, 0.99) * 1000, 3) if _latencies else None}
+
+
+async def main_async(args):
+    _rng = random.Random(args.seed)
+    _report = {'commit': git_commit(), 'duration': args.duration, 'routes': args.routes, 'targets': {}}
+    for _target in args.target:
+        _name, _url = _target.split('=', 1)
+        _quizzes = (await fetch_json(_url, '/api/quizzes?limit={0}'.format(args.quizzes)))['data']
+        if not _quizzes:
+            raise RuntimeError('{0} has no quizzes, seed its database first'.format(_url))
+        _paths = []
+        for _quiz in _quizzes:
+            if 'quiz' in args.routes:
+                _paths.append('/quiz?' + urlencode({'id': _quiz['qzid']}))
+            if 'api' in args.routes:
+                _paths.append('/api/quiz/' + _quiz['qzid'][4:])
+
+        await run_level(_url, _paths, min(args.connections), 2, args.timeout, _rng)  # warm-up
+        _report['targets'][_name] = {'url': _url, 'levels': []}
+        for _connections in args.connections:
+            _report['targets'][_name]['levels'].append(
+                await run_level(_url, _paths, _connections, args.duration, args.timeout, _rng))
+    return _report
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='WSGI vs ASGI concurrent-connection benchmark')
+    _parser.add_argument('--target', action='append', required=True,
+                         help='name=url of a running server, e.g. asgi=http://localhost:8081')
+    _parser.add_argument('--connections', type=int, nargs='+', default=[10, 100, 500])
+    _parser.add_argument('--duration', type=float, default=10.0, help='seconds per level')
+    _parser.add_argument('--timeout', type=float, default=10.0, help='seconds before a request counts as failed')
+    _parser.add_argument('--routes', nargs='+', choices=['quiz', 'api'], default=['quiz', 'api'])
+    _parser.add_argument('--quizzes', type=int, default=100, help='quiz ids read from /api/quizzes')
+    _parser.add_argument('--seed', type=int, default=42)
+    _parser.add_argument('--output', help='write the JSON report to this file')
+    _args = _parser.parse_args()
+
+    _report = asyncio.run(main_async(_args))
+    _text = json.dumps(_report, indent=2)
+    if _args.output:
+        with open(_args.output, 'w', encoding='utf-8') as _file:
+            _file.write(_text + '\n')
+    print(_text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark of grading.grade() against the former nested-loop grading of nouns_quiz
+
+    $ python benchmarks/bench_grading.py
+    $ python benchmarks/bench_grading.py --sizes 5 50 500 5000 --repeat 200
+
+Per-item time of grade() stays flat as quizzes grow, the nested loops grow with the quiz size.
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from grading import build_answer_key  # noqa: E402
+from grading import grade  # noqa: E402
+
+ARTICLES = ('der', 'die', 'das')
+
+
+def make_quiz(size):
+    """
+    Synthetic 'questions' and 'quizzes' documents, and a submission answering half of the items
+
+    :param size: number of quiz items
+    :type size: int
+
+    :rtype: tuple
+    :return: (question, quiz, choices)
+    """
+    _question = {'quid': 'QID-bench', 'data': []}
+    _quiz = {'cif': 'CIF-bench', 'quid': 'QID-bench', 'qzid': 'QIZ-bench', 'name': 'bench', 'data': []}
+    _choices = {}
+    for _i in range(size):
+        _label = 'Q{0:05d}'.format(_i)
+        _item = {'Label': _label, 'Noun': 'Noun{0}'.format(_i), 'Opt1': 'der', 'Opt2': 'die', 'Opt3': 'das',
+                 'Plural': 'Nouns{0}'.format(_i), 'Desc': 'Noun {0}'.format(_i)}
+        _quiz['data'].append(dict(_item))
+        _item['Ans'] = ARTICLES[_i % 3]
+        _question['data'].append(_item)
+        if _i % 2 == 0:
+            _choices[_label] = ARTICLES[_i % 2]
+    return _question, _quiz, _choices
+
+
+def legacy_grade(question, quiz, choices):
+    """Nested-loop grading as nouns_quiz did it before grading.py, O(n*m)"""
+    _quiz = copy.deepcopy(quiz)
+    for _x in _quiz['data']:
+        _x['Ans'] = None
+        _x['Correct'] = 'x'
+        _x['Choice'] = None
+        _x['Plural'] = None
+    for _x in _quiz['data']:
+        for _y in question['data']:
+            if _x['Label'] == _y['Label']:
+                _x['Ans'] = _y['Ans']
+                _x['Plural'] = _y['Plural']
+    for _key, _value in choices.items():
+        for _y in _quiz['data']:
+            if _key == _y['Label']:
+                _y['Choice'] = _value
+                _y['Correct'] = 'n'
+                if _value == _y['Ans']:
+                    _y['Correct'] = 'y'
+    return _quiz
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='grading micro-benchmark')
+    _parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 500])
+    _parser.add_argument('--repeat', type=int, default=100)
+    _args = _parser.parse_args()
+
+    _report = []
+    for _size in _args.sizes:
+        _question, _quiz, _choices = make_quiz(_size)
+        _answer_key = build_answer_key(_question)  # built once per quid, cached by grading.AnswerKeys
+        _grade = min(timeit.repeat(lambda: grade(_quiz, _answer_key, _choices), number=_args.repeat, repeat=3))
+        _legacy = min(timeit.repeat(lambda: legacy_grade(_question, _quiz, _choices), number=_args.repeat,
+                                    repeat=3))
+        _report.append({'items': _size,
+                        'grade_us': round(_grade / _args.repeat * 1e6, 2),
+                        'grade_us_per_item': round(_grade / _args.repeat / _size * 1e6, 4),
+                        'legacy_us': round(_legacy / _args.repeat * 1e6, 2),
+                        'legacy_us_per_item': round(_legacy / _args.repeat / _size * 1e6, 4)})
+
+    print(json.dumps(_report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
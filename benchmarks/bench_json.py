@@ -0,0 +1,121 @@
+"""
+JSON encode time and bytes sent per API route, see jsonprovider.py and compression.py
+
+    $ python benchmarks/bench_json.py
+    $ python benchmarks/bench_json.py --banks 1000 --items 200 --repeat 200 --output json-$(git rev-parse --short HEAD).json
+
+MongoDB is an in-process mongomock stand-in seeded as by bench_load.py. For each route:
+
+* encode_us: time to encode the route's JSON payload with Flask's DefaultJSONProvider (stdlib
+  json, as jsonify() did before) and with jsonprovider.JSONProvider (orjson when installed);
+* bytes: body size sent for each Accept-Encoding, identity, gzip and br (when Brotli is installed);
+* request_ms: time per request through the WSGI application, compression included.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import timeit
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_load import git_commit  # noqa: E402
+from bench_load import seed  # noqa: E402
+
+
+def routes(quizzes, questions):
+    """
+    Route name -> (path, Accept header) of the JSON routes measured
+
+    :rtype: dict
+    """
+    _quiz = max(quizzes, key=lambda _x: len(_x['data']))
+    _question = max(questions, key=lambda _x: len(_x['data']))
+    return {
+        'GET /api/quiz/<id>': ('/api/quiz/' + _quiz['qzid'][4:], 'application/json'),
+        'GET /api/question/<id>': ('/api/question/' + _question['quid'][4:], 'application/json'),
+        'GET /api/questions?limit=1000': ('/api/questions?limit=1000', 'application/json'),
+        'GET /api/quizzes (stream)': ('/api/quizzes', 'application/json'),
+        'GET /api/questions (ndjson)': ('/api/questions', 'application/x-ndjson'),
+        'GET /quiz': ('/quiz?' + urlencode({'id': _quiz['qzid']}), 'text/html'),
+    }
+
+
+def payloads(body, accept):
+    """Objects encoded for a response body: the document, one per NDJSON line, none for HTML"""
+    if accept == 'application/json':
+        return [json.loads(body)]
+    if accept == 'application/x-ndjson':
+        return [json.loads(_line) for _line in body.splitlines()]
+    return []
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='JSON encoding and compression benchmark')
+    _parser.add_argument('--banks', type=int, default=200, help='synthetic question banks and quizzes')
+    _parser.add_argument('--items', type=int, default=50, help='nouns per synthetic bank')
+    _parser.add_argument('--repeat', type=int, default=100, help='encodings and requests per measure')
+    _parser.add_argument('--seed', type=int, default=42)
+    _parser.add_argument('--output', help='write the JSON report to this file')
+    _args = _parser.parse_args()
+
+    try:
+        import mongomock
+    except ImportError:
+        _parser.error('mongomock is not installed: pip install -r benchmarks/requirements.txt')
+    _client = mongomock.MongoClient()
+    _quizzes, _questions = seed(_client['flask_bench'], _args.banks, _args.items, random.Random(_args.seed))
+
+    import compression
+    import database
+    import jsonprovider
+    import wsgi
+    from flask.json.provider import DefaultJSONProvider
+    database.configure(None, 'flask_bench')
+    database.use_client(_client)
+
+    _stdlib = DefaultJSONProvider(wsgi.application)
+    _encoders = {'json': lambda _obj: _stdlib.dumps(_obj, separators=(',', ':')).encode(),
+                 jsonprovider.encoder(): wsgi.application.json.dumpb}
+    _encodings = ['identity'] + compression.available_encodings()
+    _test_client = wsgi.application.test_client()
+
+    def _get(path, accept, encoding):
+        # closing the response frees its admission slot, see admission.py
+        with _test_client.get(path, headers={'Accept': accept, 'Accept-Encoding': encoding}) as _response:
+            if _response.status_code != 200:
+                raise RuntimeError('{0}: {1}'.format(path, _response.status_code))
+            return _response.get_data()
+
+    _report = {'commit': git_commit(), 'encoder': jsonprovider.encoder(), 'questions': len(_questions),
+               'quizzes': len(_quizzes), 'items': _args.items,
+               'min_size': wsgi.application.config["COMPRESS_MIN_SIZE"], 'routes': {}}
+    for _route, (_path, _accept) in routes(_quizzes, _questions).items():
+        _result = {'encode_us': {}, 'bytes': {}, 'request_ms': {}}
+        _objects = payloads(_get(_path, _accept, 'identity'), _accept)
+        if _objects:
+            for _name, _encode in _encoders.items():
+                _seconds = min(timeit.repeat(lambda: [_encode(_obj) for _obj in _objects],
+                                             number=_args.repeat, repeat=3))
+                _result['encode_us'][_name] = round(_seconds / _args.repeat * 1e6, 1)
+        for _encoding in _encodings:
+            _result['bytes'][_encoding] = len(_get(_path, _accept, _encoding))
+            _start = time.perf_counter()
+            for _x in range(_args.repeat):
+                _get(_path, _accept, _encoding)
+            _result['request_ms'][_encoding] = round((time.perf_counter() - _start) / _args.repeat * 1000, 3)
+        _report['routes'][_route] = _result
+
+    _text = json.dumps(_report, indent=2)
+    if _args.output:
+        with open(_args.output, 'w', encoding='utf-8') as _file:
+            _file.write(_text + '\n')
+    print(_text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Load test of wsgi:application, throughput and p50/p95/p99 latency per route as JSON
+
+MongoDB is an in-process mongomock stand-in (pip install -r benchmarks/requirements.txt), or a
+local mongod given with --mongo-uri; either is seeded from tests/data/mongodb-test-data.txt plus
+--banks synthetic question banks of --items nouns. Requests go straight to the WSGI callable
+through werkzeug's test client from --concurrency threads, or over HTTP to a running server
+with --url (seed that server's database with --mongo-uri).
+
+    $ python benchmarks/bench_load.py --output bench-$(git rev-parse --short HEAD).json
+    $ python benchmarks/bench_load.py --banks 1000 --items 50 --concurrency 8 --requests 2000
+    $ python benchmarks/bench_load.py --baseline bench-1234abc.json   # adds the change in % per route
+
+In-process, the worker's admission limit (see admission.py) is raised to --concurrency: a 503
+means the run measured refusals, not the route, it is counted in 'refused' and fails the run.
+
+The aggregation grading backend needs a real mongod: GRADING_BACKEND=aggregate ... --mongo-uri ...
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import testdata  # noqa: E402
+
+
+def seed(db, banks, items, rng):
+    """
+    Empty and load 'questions' and 'quizzes' with the test data file and synthetic banks
+
+    :rtype: tuple
+    :return: (list of quizzes documents, list of questions documents)
+    """
+    _questions = []
+    _quizzes = []
+    for _collection, _document in testdata.parse_test_data():
+        (_questions if _collection == 'questions' else _quizzes).append(_document)
+    for _i in range(banks):
+        _question, _quiz = testdata.synthetic_bank(items, rng)
+        _questions.append(_question)
+        _quizzes.append(_quiz)
+
+    db.questions.drop()
+    db.quizzes.drop()
+    db.questions.insert_many([dict(_x) for _x in _questions])
+    db.quizzes.insert_many([dict(_x) for _x in _quizzes])
+    return _quizzes, _questions
+
+
+def scenarios(quizzes, rng):
+    """
+    Request factories for the main routes, each returns (method, path, form data or None)
+
+    :rtype: dict
+    :return: {'GET /quiz': callable, ...}
+    """
+    def _quiz():
+        return quizzes[rng.randrange(len(quizzes))]
+
+    def _get_quiz():
+        return 'GET', '/quiz?' + urlencode({'id': _quiz()['qzid']}), None
+
+    def _post_quiz():
+        _x = _quiz()
+        _form = {'cif': _x['cif'][4:], 'quid': _x['quid'][4:], 'qzid': _x['qzid'][4:]}
+        for _item in _x['data']:
+            if rng.random() < 0.8:
+                _form['name-radio-' + _item['Label']] = rng.choice(('der', 'die', 'das'))
+        return 'POST', '/quiz', _form
+
+    def _api_quiz():
+        return 'GET', '/api/quiz/' + _quiz()['qzid'][4:], None
+
+    return {
+        'GET /quiz': _get_quiz,
+        'POST /quiz': _post_quiz,
+        'GET /api/quiz/<id>': _api_quiz,
+        'GET /api/questions': lambda: ('GET', '/api/questions?limit=100', None),
+        'GET /data': lambda: ('GET', '/data', None),
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def run(make_request, send, requests_total, concurrency):
+    """
+    Send requests_total requests from concurrency threads
+
+    :rtype: dict
+    :return: {'requests': ..., 'errors': ..., 'refused': ..., 'throughput_rps': ..., 'p50_ms': ..., ...}
+    """
+    _latencies = []
+    _errors = [0]
+    _refused = [0]
+    _lock = threading.Lock()
+    _remaining = [requests_total]
+
+    def _worker():
+        _session = send()
+        _local = []
+        _failed = 0
+        _busy = 0
+        while True:
+            with _lock:
+                if _remaining[0] <= 0:
+                    break
+                _remaining[0] -= 1
+            _request = make_request()
+            _start = time.perf_counter()
+            try:
+                _status = _session(*_request)
+            except Exception:
+                # a failed request is counted as an error, it does not stop the run
+                _status = 599
+            _local.append(time.perf_counter() - _start)
+            if _status == 503:
+                _busy += 1
+            elif _status >= 400:
+                _failed += 1
+        with _lock:
+            _latencies.extend(_local)
+            _errors[0] += _failed
+            _refused[0] += _busy
+
+    _threads = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    _start = time.perf_counter()
+    for _thread in _threads:
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+    _elapsed = time.perf_counter() - _start
+
+    _latencies.sort()
+    return {'requests': len(_latencies), 'errors': _errors[0], 'refused': _refused[0],
+            'throughput_rps': round(len(_latencies) / _elapsed, 1),
+            'p50_ms': round(percentile(_latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(_latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(_latencies, 0.99) * 1000, 3)}
+
+
+def wsgi_sender(application):
+    """Per-thread sender calling the WSGI application in-process"""
+    def _send():
+        _client = application.test_client()
+
+        def _request(method, path, form):
+            # closing the response frees its admission slot, as a WSGI server does, see admission.py
+            with _client.open(path, method=method, data=form) as _response:
+                return _response.status_code
+        return _request
+    return _send
+
+
+def http_sender(url):
+    """Per-thread sender using a keep-alive requests.Session against a running server"""
+    import requests
+
+    def _send():
+        _session = requests.Session()
+
+        def _request(method, path, form):
+            return _session.request(method, url.rstrip('/') + path, data=form, timeout=30).status_code
+        return _request
+    return _send
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='flask-play load test')
+    _parser.add_argument('--mongo-uri', help='local mongod to seed, default: in-process mongomock')
+    _parser.add_argument('--mongo-db', default='flask_bench')
+    _parser.add_argument('--url', help='running server, e.g. http://localhost:8080, default: in-process WSGI')
+    _parser.add_argument('--banks', type=int, default=100, help='synthetic question banks and quizzes')
+    _parser.add_argument('--items', type=int, default=20, help='nouns per synthetic bank')
+    _parser.add_argument('--requests', type=int, default=1000, help='requests per route')
+    _parser.add_argument('--concurrency', type=int, default=4)
+    _parser.add_argument('--routes', nargs='+', help='subset of routes, e.g. "GET /quiz"')
+    _parser.add_argument('--seed', type=int, default=42)
+    _parser.add_argument('--baseline', help='earlier JSON report to compare with')
+    _parser.add_argument('--output', help='write the JSON report to this file')
+    _args = _parser.parse_args()
+
+    _rng = random.Random(_args.seed)
+
+    if _args.mongo_uri:
+        from pymongo import MongoClient
+        _client = MongoClient(_args.mongo_uri)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            _parser.error('mongomock is not installed: pip install -r benchmarks/requirements.txt, or use --mongo-uri')
+        _client = mongomock.MongoClient()
+    _quizzes, _questions = seed(_client[_args.mongo_db], _args.banks, _args.items, _rng)
+
+    if _args.url:
+        _send = http_sender(_args.url)
+    else:
+        import database
+        import wsgi
+        database.configure(_args.mongo_uri, _args.mongo_db)
+        database.use_client(_client)
+        # every benchmark thread is a request in flight: none may be refused nor queued
+        wsgi._admission.limit = max(wsgi._admission.limit, _args.concurrency)
+        _send = wsgi_sender(wsgi.application)
+
+    _scenarios = scenarios(_quizzes, _rng)
+    _results = {}
+    for _route, _make_request in _scenarios.items():
+        if _args.routes and _route not in _args.routes:
+            continue
+        run(_make_request, _send, min(50, _args.requests), 1)  # warm-up: caches, connections
+        _results[_route] = run(_make_request, _send, _args.requests, _args.concurrency)
+
+    _report = {'commit': git_commit(), 'python': platform.python_version(),
+               'mongo': 'mongod' if _args.mongo_uri else 'mongomock', 'target': _args.url or 'wsgi',
+               'grading_backend': os.environ.get('GRADING_BACKEND', 'python'),
+               'questions': len(_questions), 'quizzes': len(_quizzes), 'items': _args.items,
+               'concurrency': _args.concurrency, 'routes': _results}
+
+    if _args.baseline:
+        with open(_args.baseline, encoding='utf-8') as _file:
+            _baseline = json.load(_file)
+        for _route, _result in _results.items():
+            _before = _baseline.get('routes', {}).get(_route)
+            if _before:
+                _result['change_pct'] = {_key: round((_result[_key] - _before[_key]) / _before[_key] * 100, 1)
+                                         for _key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+                                         if _before.get(_key)}
+        _report['baseline'] = _baseline.get('commit')
+
+    _text = json.dumps(_report, indent=2)
+    if _args.output:
+        with open(_args.output, 'w', encoding='utf-8') as _file:
+            _file.write(_text + '\n')
+    print(_text)
+
+    _refused = {_route: _result['refused'] for _route, _result in _results.items() if _result['refused']}
+    if _refused:
+        _parser.exit(1, 'refused with 503, throughput is not comparable: {0}\n'.format(_refused))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Micro-benchmark of the /api/search/nouns index, see nounindex.py
+
+    $ python benchmarks/bench_search.py
+    $ python benchmarks/bench_search.py --banks 10000 --items 100 --repeat 2000
+
+Builds the index from synthetic question banks and reports the build time and the time per search
+of typeahead prefixes, umlaut spellings and typos.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from nounindex import NounIndex  # noqa: E402
+from testdata import synthetic_bank  # noqa: E402
+
+# (kind, query)
+QUERIES = [
+    ('prefix', 'b'), ('prefix', 'sch'), ('prefix', 'Fahrr'), ('umlaut', 'Bruecke'), ('umlaut', 'Schlussel'),
+    ('eszett', 'Strasse'), ('typo', 'Schlüsel'), ('typo', 'Lofel'), ('english', 'bicy'),
+]
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='noun search micro-benchmark')
+    _parser.add_argument('--banks', type=int, default=1000)
+    _parser.add_argument('--items', type=int, default=50)
+    _parser.add_argument('--limit', type=int, default=10)
+    _parser.add_argument('--repeat', type=int, default=1000)
+    _args = _parser.parse_args()
+
+    _rng = random.Random(42)
+    _questions = [synthetic_bank(_args.items, _rng)[0] for _x in range(_args.banks)]
+
+    _index = NounIndex()
+    _start = time.perf_counter()
+    _index.add(_questions)
+    _report = {'banks': _args.banks, 'items': _args.items, 'build_seconds': round(time.perf_counter() - _start, 3),
+               'index': _index.stats(), 'searches': []}
+
+    for _kind, _query in QUERIES:
+        _seconds = min(timeit.repeat(lambda: _index.search(_query, _args.limit), number=_args.repeat, repeat=3))
+        _results = _index.search(_query, _args.limit)
+        _report['searches'].append({'kind': _kind, 'query': _query, 'results': len(_results),
+                                    'first': _results[0]['Noun'] if _results else None,
+                                    'search_us': round(_seconds / _args.repeat * 1e6, 2)})
+
+    print(json.dumps(_report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
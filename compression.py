@@ -0,0 +1,257 @@
+"""
+gzip/brotli compression of dynamic responses, negotiated with Accept-Encoding
+
+    application.wsgi_app = compression.CompressionMiddleware(application.wsgi_app, min_size=1024)
+
+A response with a Content-Length is compressed in one go when it has at least min_size bytes.
+A streamed response (no Content-Length: the /api/questions and /api/quizzes listings, NDJSON,
+/api/grade/batch) is compressed as it is generated, never held in memory, and flushed every
+flush_size bytes of input so clients can decode it progressively.
+
+Left as they are: HEAD requests, 1xx/204/206/304 responses, a Content-Encoding already set
+(precompressed static files, see assets.py), Cache-Control: no-transform and types not in
+COMPRESSIBLE. 'Vary: Accept-Encoding' is added to every response of a compressible type and a
+strong ETag of a compressed response becomes weak: the bytes differ from the identity encoding,
+If-None-Match still matches (weak comparison) and gets 304. That 304 is not compressed: a view
+answering conditional requests weakens the ETag itself when encoding() would compress the 200.
+"""
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # optional, as for assets.py: responses are then gzip compressed only
+        brotli = None
+
+# Content-Types worth compressing, besides text/*
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+
+def available_encodings():
+    """
+    Content-Encodings the middleware can produce, preferred first
+
+    :rtype: list
+    :return: e.g. ['br', 'gzip']
+    """
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def compressible(mimetype):
+    """
+    :param mimetype: e.g. 'application/json'
+    :type mimetype: str
+
+    :rtype: Boolean
+    :return: True for text/* and COMPRESSIBLE types
+    """
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    Content-Encoding to use for a request
+
+    :param accept_encoding: Accept-Encoding request header, e.g. 'gzip, deflate, br'
+    :type accept_encoding: str
+    :param encodings: encodings available, preferred first, e.g. ['br', 'gzip']
+    :type encodings: list
+
+    :rtype: str
+    :return: one of encodings, or None for identity
+    """
+    if not accept_encoding:
+        return None
+    return parse_accept_header(accept_encoding).best_match(encodings)
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _Stream:
+    """Compressed body of a streamed response, closes the response it wraps"""
+
+    def __init__(self, body, compressor, flush_size):
+        self._body = body
+        self._compressor = compressor
+        self._flush_size = flush_size
+
+    def __iter__(self):
+        _pending = 0
+        for _chunk in self._body:
+            if not _chunk:
+                continue
+            _data = self._compressor.compress(_chunk)
+            _pending += len(_chunk)
+            if _pending >= self._flush_size:
+                _data += self._compressor.flush()
+                _pending = 0
+            if _data:
+                yield _data
+        yield self._compressor.finish()
+
+    def close(self):
+        if hasattr(self._body, 'close'):
+            self._body.close()
+
+
+class CompressionMiddleware:
+    """
+    WSGI middleware compressing the responses of app, see the module docstring; app calls
+    start_response() before returning the body, as Flask does
+
+    :param app: WSGI application, e.g. application.wsgi_app
+    :param min_size: smallest Content-Length compressed, in bytes
+    :param gzip_level: zlib level, 1 (fast) to 9 (small)
+    :param brotli_quality: 0 (fast) to 11 (small), 4 suits responses compressed per request
+    :param flush_size: bytes of a streamed response compressed before its output is flushed
+    :param encodings: Content-Encodings offered, preferred first, default available_encodings()
+    """
+
+    def __init__(self, app, min_size=1024, gzip_level=6, brotli_quality=4, flush_size=16384, encodings=None):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.flush_size = flush_size
+        self.encodings = [_encoding for _encoding in (encodings or available_encodings())
+                          if _encoding in available_encodings()]
+
+    def __call__(self, environ, start_response):
+        _response = []
+
+        def _start_response(status, headers, exc_info=None):
+            # held back until the body is known: the Content-Length of a compressed body changes
+            _response[:] = [status, headers, exc_info]
+            return self._write
+
+        _body = self.app(environ, _start_response)
+        _status, _headers, _exc_info = _response
+        _headers = Headers(_headers)
+        _compressor = self.compressor(environ, _status, _headers)
+        if _compressor is None:
+            start_response(_status, _headers.to_wsgi_list(), _exc_info)
+            return _body
+
+        if 'Content-Length' not in _headers:
+            start_response(_status, _headers.to_wsgi_list(), _exc_info)
+            return _Stream(_body, _compressor, self.flush_size)
+
+        try:
+            _data = _compressor.compress(b''.join(_body)) + _compressor.finish()
+        finally:
+            if hasattr(_body, 'close'):
+                _body.close()
+        _headers['Content-Length'] = str(len(_data))
+        start_response(_status, _headers.to_wsgi_list(), _exc_info)
+        return [_data]
+
+    @staticmethod
+    def _write(data):
+        raise RuntimeError('write() is not supported by CompressionMiddleware, return the body instead')
+
+    def compressor(self, environ, status, headers):
+        """
+        Compressor for a response, updates its headers (Vary, Content-Encoding, ETag)
+
+        :param environ: WSGI environ of the request
+        :type environ: dict
+        :param status: e.g. '200 OK'
+        :type status: str
+        :param headers: response headers, modified in place
+        :type headers: werkzeug.datastructures.Headers
+
+        :return: object with compress(), flush() and finish(), or None to send the response as it is
+        """
+        _code = int(status.split(None, 1)[0])
+        if _code < 200 or _code in (204, 206, 304) or 'Content-Encoding' in headers:
+            return None
+        _mimetype = headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        if not compressible(_mimetype):
+            return None
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return None
+
+        if 'accept-encoding' not in headers.get('Vary', '').lower():
+            headers.add('Vary', 'Accept-Encoding')
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return None
+        _encoding = self.encoding(environ, _mimetype, headers.get('Content-Length', type=int))
+        if _encoding is None:
+            return None
+
+        headers['Content-Encoding'] = _encoding
+        _etag = headers.get('ETag')
+        if _etag and not _etag.startswith('W/'):
+            headers['ETag'] = 'W/' + _etag
+        return _Brotli(self.brotli_quality) if _encoding == 'br' else _Gzip(self.gzip_level)
+
+    def encoding(self, environ, mimetype, length):
+        """
+        Content-Encoding of a response body for a request, e.g. to send on a 304 the weak ETag
+        the 200 of a compressed body has
+
+        :param environ: WSGI environ of the request
+        :type environ: dict
+        :param mimetype: e.g. 'application/json'
+        :type mimetype: str
+        :param length: body size in bytes, None when streamed
+        :type length: int
+
+        :rtype: str
+        :return: e.g. 'gzip', None when the body is sent as it is
+        """
+        if not compressible(mimetype):
+            return None
+        if length is not None and length < self.min_size:
+            return None
+        return negotiate(environ.get('HTTP_ACCEPT_ENCODING'), self.encodings)
+
+    def compress_response(self, response, environ):
+        """
+        Compress a werkzeug Response in place, for responses not sent through __call__ (see asgi.py);
+        streamed responses are left as they are
+
+        :param response: flask.Response
+        :param environ: WSGI environ of the request
+        :type environ: dict
+
+        :rtype: flask.Response
+        :return: response
+        """
+        if response.is_streamed:
+            return response
+        _compressor = self.compressor(environ, response.status, response.headers)
+        if _compressor is not None:
+            response.set_data(_compressor.compress(response.get_data()) + _compressor.finish())
+        return response
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """
+    Per-worker cache of rendered HTML fragments, e.g. the body of a quiz page
+
+    Keys are (template, qzid, document version, theme), so a changed quiz or theme is a new
+    entry and stale ones age out. Entries are evicted least recently used once their total
+    size exceeds 'max_bytes'. The render time of each fragment is kept to report the time saved.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.render_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def render(self, key, render):
+        """
+        Cached render() output for key
+
+        :param key: (template, qzid, version, theme), e.g. ('nouns-quiz-body.html', 'QIZ-...', 17, 'herbie')
+        :type key: tuple
+        :param render: renders the fragment, called on a miss only
+        :type render: callable
+
+        :rtype: markupsafe.Markup
+        :return: the fragment, safe to insert in a template
+        """
+        if self.max_bytes <= 0:
+            return Markup(render())
+
+        with self._lock:
+            _entry = self._entries.get(key)
+            if _entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += _entry['seconds']
+                return _entry['html']
+
+        _start = time.perf_counter()
+        _html = Markup(render())
+        _seconds = time.perf_counter() - _start
+        _size = len(_html.encode('utf-8'))
+
+        with self._lock:
+            self.misses += 1
+            self.render_seconds += _seconds
+            if _size <= self.max_bytes:
+                _previous = self._entries.pop(key, None)
+                if _previous is not None:
+                    self.size -= _previous['size']
+                self._entries[key] = {'html': _html, 'size': _size, 'seconds': _seconds}
+                self.size += _size
+                while self.size > self.max_bytes:
+                    _key, _evicted = self._entries.popitem(last=False)
+                    self.size -= _evicted['size']
+                    self.evictions += 1
+        return _html
+
+    def invalidate(self, tag=None):
+        """
+        Drop cached fragments
+
+        :param tag: 'qzid' value, e.g. 'QIZ-3021178c-...', None drops everything
+        :type tag: str
+
+        :rtype: int
+        :return: number of entries removed
+        """
+        with self._lock:
+            _keys = [_key for _key in self._entries if tag is None or _key[1] == tag]
+            for _key in _keys:
+                self.size -= self._entries.pop(_key)['size']
+            return len(_keys)
+
+    def stats(self):
+        """
+        Hit/miss counters and render time, 'saved_seconds' is the render time hits did not spend
+
+        :rtype: dict
+        :return: {'entries': ..., 'bytes': ..., 'max_bytes': ..., 'hits': ..., 'saved_seconds': ..., ...}
+        """
+        with self._lock:
+            _lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_ratio': round(self.hits / _lookups, 4) if _lookups else 0.0,
+                    'render_seconds': round(self.render_seconds, 6),
+                    'saved_seconds': round(self.saved_seconds, 6)}
@@ -0,0 +1,419 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections import namedtuple
+
+# One graded quiz row, field names match those used by templates/nouns-result.html
+GradedItem = namedtuple('GradedItem', ['Label', 'Noun', 'Opt1', 'Opt2', 'Opt3', 'Plural', 'Desc',
+                                       'Ans', 'Choice', 'Correct'])
+
+
+class GradeResult(namedtuple('GradeResult', ['name', 'cif', 'quid', 'qzid', 'items',
+                                             'correct', 'incorrect', 'unanswered'])):
+    """
+    Immutable outcome of grading one submission, 'items' is a tuple of GradedItem
+    """
+    __slots__ = ()
+
+    def meta_data(self):
+        """
+        Summary as consumed by nouns-result.html, ids without their 'CIF-', 'QID-', 'QIZ-' prefix
+
+        :rtype: dict
+        :return: {'name': ..., 'cif': ..., 'quid': ..., 'qzid': ..., 'correct': ..., ...}
+        """
+        return {'name': self.name, 'cif': self.cif.replace('CIF-', ''),
+                'quid': self.quid.replace('QID-', ''), 'qzid': self.qzid.replace('QIZ-', ''),
+                'correct': self.correct, 'incorrect': self.incorrect, 'unanswered': self.unanswered}
+
+    def data(self):
+        """
+        Graded rows as plain dictionaries, e.g. for jsonify()
+
+        :rtype: list
+        :return: [{'Label': 'Q01', 'Noun': 'Briefmarke', 'Ans': 'die', 'Choice': 'der', 'Correct': 'n', ...}, ...]
+        """
+        return [_item._asdict() for _item in self.items]
+
+    def document(self, submitted):
+        """
+        'results' collection document, ids keep their prefix
+
+        :param submitted: submission time, timezone aware
+        :type submitted: datetime.datetime
+
+        :rtype: dict
+        :return: {'cif': ..., 'quid': ..., 'qzid': ..., 'name': ..., 'submitted': ..., 'correct': ..., ...,
+                  'items': [{'Label': 'Q01', 'Noun': 'Briefmarke', 'Choice': 'der', 'Correct': 'n'}, ...]}
+        """
+        return {'cif': self.cif, 'quid': self.quid, 'qzid': self.qzid, 'name': self.name, 'submitted': submitted,
+                'correct': self.correct, 'incorrect': self.incorrect, 'unanswered': self.unanswered,
+                'items': [{'Label': _item.Label, 'Noun': _item.Noun, 'Correct': _item.Correct,
+                           'Choice': str(_item.Choice) if _item.Choice is not None else None}
+                          for _item in self.items]}
+
+
+def build_answer_key(question):
+    """
+    Index a 'questions' document by Label
+
+    :param question: document with 'data': [{'Label': 'Q01', 'Ans': 'die', 'Plural': 'Briefmarken', ...}, ...]
+    :type question: dict
+
+    :rtype: dict
+    :return: {'Q01': ('die', 'Briefmarken'), ...}
+    """
+    return {_x['Label']: (_x.get('Ans'), _x.get('Plural')) for _x in question['data']}
+
+
+def grade(quiz, answer_key, choices):
+    """
+    Grade a sanitized submission in a single pass over the quiz items
+
+    Items without a choice are 'x' (unanswered), otherwise 'y' or 'n'. 'Ans' and 'Plural'
+    come from the answer key, None if the Label is not in it. Nothing passed in is modified.
+
+    :param quiz: 'quizzes' document, {'cif': ..., 'quid': ..., 'qzid': ..., 'name': ..., 'data': [...]}
+    :type quiz: dict
+    :param answer_key: see build_answer_key()
+    :type answer_key: dict
+    :param choices: submitted article per Label, e.g. {'Q01': 'der', 'Q02': 'die'}
+    :type choices: dict
+
+    :rtype: GradeResult
+    :return: graded items and correct/incorrect/unanswered totals
+    """
+    _items = []
+    _correct_ans = 0
+    _incorrect_ans = 0
+    _unanswered = 0
+
+    for _x in quiz['data']:
+        _label = _x['Label']
+        _ans, _plural = answer_key.get(_label, (None, None))
+        _choice = choices.get(_label)
+
+        if _choice is None:
+            _correct = 'x'
+            _unanswered += 1
+        elif _choice == _ans:
+            _correct = 'y'
+            _correct_ans += 1
+        else:
+            _correct = 'n'
+            _incorrect_ans += 1
+
+        _items.append(GradedItem(_label, _x.get('Noun'), _x.get('Opt1'), _x.get('Opt2'), _x.get('Opt3'),
+                                 _plural, _x.get('Desc'), _ans, _choice, _correct))
+
+    return GradeResult(quiz['name'], quiz['cif'], quiz['quid'], quiz['qzid'], tuple(_items),
+                       _correct_ans, _incorrect_ans, _unanswered)
+
+
+def grading_pipeline(qzid, quid, choices):
+    """
+    Aggregation on 'quizzes' joining the answer key of 'questions' and grading server-side
+
+    The output document has the fields of GradeResult, 'data' items those of GradedItem
+    (absent rather than null when a value is missing), and 'questions' the number of
+    matching 'questions' documents (0 when quid is unknown).
+
+    :param qzid: quiz id, e.g. 'QIZ-d1e25109-ef1d-429c-9595-0fbf820ced86'
+    :type qzid: str
+    :param quid: question id, e.g. 'QID-ba88f889-37d3-41ec-8829-d7ea2a45c61c'
+    :type quid: str
+    :param choices: submitted article per Label, e.g. {'Q01': 'der', 'Q02': 'die'}
+    :type choices: dict
+
+    :rtype: list
+    :return: pipeline for db.quizzes.aggregate()
+    """
+    _labels = list(choices)
+    _values = [str(choices[_label]) for _label in _labels]
+
+    def _count(correct):
+        return {'$size': {'$filter': {'input': '$data', 'as': 'x', 'cond': {'$eq': ['$$x.Correct', correct]}}}}
+
+    # graded item, '$$key' is the answer key entry with the same Label ({} if none)
+    _graded_item = {'Label': '$$item.Label', 'Noun': '$$item.Noun', 'Opt1': '$$item.Opt1', 'Opt2': '$$item.Opt2',
+                    'Opt3': '$$item.Opt3', 'Plural': '$$key.Plural', 'Desc': '$$item.Desc', 'Ans': '$$key.Ans',
+                    'Choice': '$$choice',
+                    'Correct': {'$cond': [{'$eq': ['$$choice', None]}, 'x',
+                                          {'$cond': [{'$eq': ['$$choice', '$$key.Ans']}, 'y', 'n']}]}}
+    _lookup_item = {'$let': {
+        'vars': {'a': {'$indexOfArray': ['$$answers.Label', '$$item.Label']},
+                 'c': {'$indexOfArray': [{'$literal': _labels}, '$$item.Label']}},
+        'in': {'$let': {
+            'vars': {'key': {'$cond': [{'$gte': ['$$a', 0]}, {'$arrayElemAt': ['$$answers', '$$a']},
+                                       {'$literal': {}}]},
+                     'choice': {'$cond': [{'$gte': ['$$c', 0]}, {'$arrayElemAt': [{'$literal': _values}, '$$c']},
+                                          None]}},
+            'in': _graded_item}}}}
+
+    return [
+        {'$match': {'qzid': qzid}},
+        {'$limit': 1},
+        {'$lookup': {'from': 'questions', 'as': 'question',
+                     'pipeline': [{'$match': {'quid': quid}}, {'$limit': 1},
+                                  {'$project': {'_id': 0, 'data.Label': 1, 'data.Ans': 1, 'data.Plural': 1}}]}},
+        {'$project': {'_id': 0, 'cif': 1, 'quid': 1, 'qzid': 1, 'name': 1,
+                      'questions': {'$size': '$question'},
+                      'data': {'$let': {
+                          'vars': {'answers': {'$ifNull': [{'$arrayElemAt': ['$question.data', 0]}, []]}},
+                          'in': {'$map': {'input': '$data', 'as': 'item', 'in': _lookup_item}}}}}},
+        {'$addFields': {'correct': _count('y'), 'incorrect': _count('n'), 'unanswered': _count('x')}},
+    ]
+
+
+def grade_aggregate(quizzes, qzid, quid, choices):
+    """
+    Grade a sanitized submission in one MongoDB round trip, see grading_pipeline()
+
+    :param quizzes: pymongo Collection, e.g. _db.quizzes
+    :param qzid: quiz id, e.g. 'QIZ-d1e25109-ef1d-429c-9595-0fbf820ced86'
+    :type qzid: str
+    :param quid: question id, e.g. 'QID-ba88f889-37d3-41ec-8829-d7ea2a45c61c'
+    :type quid: str
+    :param choices: submitted article per Label, e.g. {'Q01': 'der', 'Q02': 'die'}
+    :type choices: dict
+
+    :rtype: GradeResult
+    :return: same result as grade(), None if qzid or quid is unknown
+    """
+    _docs = list(quizzes.aggregate(grading_pipeline(qzid, quid, choices)))
+    if not _docs or not _docs[0]['questions']:
+        return None
+
+    _doc = _docs[0]
+    _items = []
+    for _x in _doc['data']:
+        _item = {_field: _x.get(_field) for _field in GradedItem._fields}
+        _item['Choice'] = choices.get(_item['Label'])  # keep the caller's (escaped) value
+        _items.append(GradedItem(**_item))
+
+    return GradeResult(_doc['name'], _doc['cif'], _doc['quid'], _doc['qzid'], tuple(_items),
+                       _doc['correct'], _doc['incorrect'], _doc['unanswered'])
+
+
+def normalize_id(value, prefix):
+    """
+    Accept a bare UUID4 or a prefixed one and return the prefixed form stored in MongoDB
+
+    :param value: e.g. 'd1e25109-ef1d-429c-9595-0fbf820ced86' or 'QIZ-d1e25109-ef1d-429c-9595-0fbf820ced86'
+    :type value: str
+    :param prefix: 'CIF-', 'QID-' or 'QIZ-'
+    :type prefix: str
+
+    :rtype: str
+    :return: e.g. 'QIZ-d1e25109-ef1d-429c-9595-0fbf820ced86', None if not a UUID4
+    """
+    if not isinstance(value, str):
+        return None
+    if value.startswith(prefix):
+        value = value[len(prefix):]
+    try:
+        if uuid.UUID(value).version != 4:
+            return None
+    except ValueError:
+        return None
+    return prefix + value
+
+
+def parse_submission(line):
+    """
+    Parse and sanitize one NDJSON batch submission
+
+    :param line: e.g. b'{"cif": "919ae5a5-...", "quid": "ba88f889-...", "qzid": "d1e25109-...",
+                        "choices": {"Q01": "die", "Q02": "der"}}'
+    :type line: bytes
+
+    :rtype: dict
+    :return: {'cif': 'CIF-...', 'quid': 'QID-...', 'qzid': 'QIZ-...', 'choices': {...}}
+    :raises ValueError: message describing the invalid field
+    """
+    try:
+        _submission = json.loads(line)
+    except ValueError:
+        raise ValueError('invalid json')
+    if not isinstance(_submission, dict):
+        raise ValueError('invalid json')
+
+    _values = {}
+    for _field, _prefix in (('cif', 'CIF-'), ('quid', 'QID-'), ('qzid', 'QIZ-')):
+        _values[_field] = normalize_id(_submission.get(_field), _prefix)
+        if _values[_field] is None:
+            raise ValueError('invalid {0}'.format(_field))
+
+    _choices = _submission.get('choices', {})
+    if not isinstance(_choices, dict) or not all(isinstance(_x, str) for _x in _choices.values()):
+        raise ValueError('invalid choices')
+    _values['choices'] = _choices
+    return _values
+
+
+def grade_stream(lines, load_quizzes, load_answer_keys, chunk_size=500):
+    """
+    Grade NDJSON submissions chunk by chunk, memory is bounded by chunk_size
+
+    Each chunk fetches its distinct quizzes and answer keys once, in input order results are
+    {'line': 1, 'cif': ..., 'quid': ..., 'qzid': ..., 'name': ..., 'correct': 1, 'incorrect': 1,
+    'unanswered': 3, 'results': {'Q01': 'y', 'Q02': 'n', ...}} or {'line': 2, 'error': 'invalid quid'}.
+
+    :param lines: NDJSON submissions, see parse_submission(), e.g. request.stream
+    :type lines: iterable
+    :param load_quizzes: callable, list of qzid -> {qzid: 'quizzes' document or None}
+    :type load_quizzes: function
+    :param load_answer_keys: callable, list of quid -> {quid: answer key or None}
+    :type load_answer_keys: function
+    :param chunk_size: submissions graded per lookup
+    :type chunk_size: int
+
+    :rtype: generator
+    :return: list of results per chunk
+    """
+    _chunk = []
+    _line_number = 0
+    for _line in lines:
+        _line_number += 1
+        if not _line.strip():
+            continue
+        try:
+            _chunk.append((_line_number, parse_submission(_line)))
+        except ValueError as _error:
+            _chunk.append((_line_number, str(_error)))
+        if len(_chunk) >= chunk_size:
+            yield _grade_chunk(_chunk, load_quizzes, load_answer_keys)
+            _chunk = []
+
+    if _chunk:
+        yield _grade_chunk(_chunk, load_quizzes, load_answer_keys)
+
+
+def _grade_chunk(chunk, load_quizzes, load_answer_keys):
+    """Grade one chunk of (line, submission or error message) of grade_stream()"""
+    _valid = [_submission for _line, _submission in chunk if isinstance(_submission, dict)]
+    _quizzes = load_quizzes(list({_x['qzid'] for _x in _valid})) if _valid else {}
+    _answer_keys = load_answer_keys(list({_x['quid'] for _x in _valid})) if _valid else {}
+
+    _results = []
+    for _line, _submission in chunk:
+        if not isinstance(_submission, dict):
+            _results.append({'line': _line, 'error': _submission})
+            continue
+
+        _quiz = _quizzes.get(_submission['qzid'])
+        _answer_key = _answer_keys.get(_submission['quid'])
+        if _quiz is None:
+            _results.append({'line': _line, 'error': 'unknown qzid'})
+            continue
+        if _answer_key is None:
+            _results.append({'line': _line, 'error': 'unknown quid'})
+            continue
+
+        _result = grade(_quiz, _answer_key, _submission['choices'])
+        _results.append({'line': _line, 'cif': _submission['cif'], 'quid': _submission['quid'],
+                         'qzid': _submission['qzid'], 'name': _result.name, 'correct': _result.correct,
+                         'incorrect': _result.incorrect, 'unanswered': _result.unanswered,
+                         'results': {_item.Label: _item.Correct for _item in _result.items}})
+    return _results
+
+
+class AnswerKeys:
+    """
+    Per-worker LRU of answer keys by quid, so each question bank is indexed once per 'ttl' seconds
+    """
+
+    def __init__(self, maxsize=256, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, quid, loader):
+        """
+        Answer key for quid, calling loader(quid) for the 'questions' document when not cached
+
+        :param quid: question id, e.g. 'QID-ba88f889-37d3-41ec-8829-d7ea2a45c61c'
+        :type quid: str
+        :param loader: callable returning the 'questions' document or None
+        :type loader: function
+
+        :rtype: dict
+        :return: see build_answer_key(), None if there is no such question
+        """
+        _now = time.monotonic()
+        with self._lock:
+            _entry = self._keys.get(quid)
+            if _entry is not None and _now < _entry[1]:
+                self._keys.move_to_end(quid)
+                return _entry[0]
+
+        _question = loader(quid)
+        if _question is None:
+            return None
+
+        _answer_key = build_answer_key(_question)
+        if self.maxsize > 0:
+            with self._lock:
+                self._keys[quid] = (_answer_key, _now + self.ttl)
+                self._keys.move_to_end(quid)
+                while len(self._keys) > self.maxsize:
+                    self._keys.popitem(last=False)
+        return _answer_key
+
+    def get_many(self, quids, loader):
+        """
+        Answer keys for several quids, loader(list of missing quids) is called at most once
+
+        :param quids: question ids
+        :type quids: iterable
+        :param loader: callable returning {quid: 'questions' document or None}, e.g. one '$in' query
+        :type loader: function
+
+        :rtype: dict
+        :return: {quid: answer key or None, ...}
+        """
+        _now = time.monotonic()
+        _answer_keys = {}
+        _missing = []
+        with self._lock:
+            for _quid in set(quids):
+                _entry = self._keys.get(_quid)
+                if _entry is not None and _now < _entry[1]:
+                    self._keys.move_to_end(_quid)
+                    _answer_keys[_quid] = _entry[0]
+                else:
+                    _missing.append(_quid)
+
+        if _missing:
+            _questions = loader(_missing)
+            for _quid in _missing:
+                _question = _questions.get(_quid)
+                _answer_keys[_quid] = build_answer_key(_question) if _question is not None else None
+
+            if self.maxsize > 0:
+                with self._lock:
+                    for _quid in _missing:
+                        if _answer_keys[_quid] is not None:
+                            self._keys[_quid] = (_answer_keys[_quid], _now + self.ttl)
+                            self._keys.move_to_end(_quid)
+                    while len(self._keys) > self.maxsize:
+                        self._keys.popitem(last=False)
+
+        return _answer_keys
+
+    def invalidate(self, quid=None):
+        """
+        Drop one answer key, or all of them when quid is None
+
+        :rtype: int
+        :return: number of answer keys removed
+        """
+        with self._lock:
+            if quid is None:
+                _removed = len(self._keys)
+                self._keys.clear()
+                return _removed
+            return 1 if self._keys.pop(quid, None) is not None else 0
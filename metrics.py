@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+from flask import Response
+from flask import before_render_template
+from flask import g
+from flask import request
+from flask import template_rendered
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+# gunicorn runs several worker processes: with PROMETHEUS_MULTIPROC_DIR set (see Dockerfile, config.py)
+# every worker writes its samples there and /metrics aggregates them, whichever worker answers.
+
+REQUEST_LATENCY = Histogram('flask_request_duration_seconds', 'Request latency by route',
+                            ['route', 'method', 'status'])
+REQUESTS_IN_PROGRESS = Gauge('flask_requests_in_progress', 'Requests being served by route',
+                             ['route'], multiprocess_mode='livesum')
+TEMPLATE_RENDER = Histogram('flask_template_render_seconds', 'Jinja template render time',
+                            ['template'])
+MONGO_COMMAND_LATENCY = Histogram('mongodb_command_duration_seconds', 'MongoDB command latency',
+                                  ['collection', 'command', 'outcome'],
+                                  buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+MONGO_POOL_CHECKOUT = Histogram('mongodb_pool_checkout_seconds', 'Wait for a pooled MongoDB connection',
+                                ['outcome'],
+                                buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 2))
+RESULT_QUEUE_DEPTH = Gauge('quiz_result_queue_depth', 'Graded results waiting to be written, see resultsink.py',
+                           multiprocess_mode='livesum')
+RESULT_FLUSH_LATENCY = Histogram('quiz_result_flush_seconds', 'insert_many() of a batch of graded results',
+                                 ['outcome'],
+                                 buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+RESULTS_WRITTEN = Counter('quiz_results_written', 'Graded results written to MongoDB')
+RESULTS_DROPPED = Counter('quiz_results_dropped', 'Graded results not written', ['reason'])
+ADMISSION_WAIT = Histogram('flask_admission_wait_seconds', 'Wait for a request slot, see admission.py',
+                           ['priority', 'outcome'],
+                           buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+
+
+def _route():
+    """Route pattern rather than the URL, e.g. '/api/quiz/<quiz_id>', to bound label cardinality"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = _route()
+    REQUESTS_IN_PROGRESS.labels(g.metrics_route).inc()
+
+
+def _after_request(response):
+    if 'metrics_start' in g:
+        REQUEST_LATENCY.labels(g.metrics_route, request.method, response.status_code).observe(
+            time.perf_counter() - g.metrics_start)
+    return response
+
+
+def _teardown_request(exception):
+    if 'metrics_route' in g:
+        REQUESTS_IN_PROGRESS.labels(g.metrics_route).dec()
+
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('metrics_render', []).append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    _starts = g.get('metrics_render')
+    if _starts:
+        TEMPLATE_RENDER.labels(template.name or 'string').observe(time.perf_counter() - _starts.pop())
+
+
+def metrics():
+    """
+    Prometheus text exposition of all workers, or of this process when not running multi-process
+
+    :rtype: flask.Response
+    :return: text/plain; version=0.0.4
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        _registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(_registry)
+    else:
+        _registry = REGISTRY
+    return Response(generate_latest(_registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """
+    Instrument a Flask application and add its /metrics route
+
+    :param app: Flask application, wsgi.application
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    Per-collection, per-command MongoDB latency
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        _target = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        with self._lock:
+            self._collections[(event.request_id, event.connection_id)] = _target if isinstance(_target, str) else ''
+
+    def _observe(self, event, outcome):
+        with self._lock:
+            _collection = self._collections.pop((event.request_id, event.connection_id), '')
+        MONGO_COMMAND_LATENCY.labels(_collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._observe(event, 'succeeded')
+
+    def failed(self, event):
+        self._observe(event, 'failed')
+
+
+class PoolCheckoutTimer(monitoring.ConnectionPoolListener):
+    """
+    Time spent waiting for a connection from the MongoClient pool
+    """
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKOUT.labels('checked_out').observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT.labels(str(event.reason)).observe(event.duration)
+
+    # remaining pool events are not measured
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+def mongo_listeners():
+    """
+    :rtype: list
+    :return: event_listeners for MongoClient()
+    """
+    return [CommandTimer(), PoolCheckoutTimer()]
@@ -0,0 +1,439 @@
+"""
+In-process search index over the nouns of the 'questions' collection, behind /api/search/nouns
+
+Every distinct (Noun, Ans, Plural, Desc) of all question banks is one term. A term is found by:
+
+* prefix: a sorted list of (folded key, field, term) for the Noun, the Plural and each word of the
+  Desc, searched with bisect, so typeahead costs O(log n + matches);
+* similarity: a trigram index of the folded Noun for typos ('Kalender' finds 'Kalendar'), only
+  consulted when the prefixes do not fill the requested number of results.
+
+German spelling is folded: 'Mäuse', 'Maeuse' and 'Mause' all find 'Mäuse', 'Strasse' finds 'Straße'.
+
+NounSearch keeps the index of a worker current without a MongoDB query per keystroke: it is built
+on first use, questions inserted since (by '_id') are added every 'refresh_interval' seconds in the
+background, and the whole index is rebuilt every 'rebuild_interval' seconds to pick up edits and deletes.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+
+_UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+_WORD = re.compile(r'\w+')
+
+# field ranks, a Noun match comes before a Plural match before a Desc (English) match
+NOUN, PLURAL, DESC = 0, 1, 2
+_FIELDS = ('Noun', 'Plural', 'Desc')
+
+# match classes, in result order
+EXACT, PREFIX, SIMILAR = 'exact', 'prefix', 'similar'
+_CLASSES = {EXACT: 0, PREFIX: 1, SIMILAR: 2}
+
+# quids returned with each term
+SAMPLE_SIZE = 3
+
+
+def _strip_accents(text):
+    return ''.join(_c for _c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(_c))
+
+
+def fold(text):
+    """
+    Search key of a text: case-folded, umlauts spelt out, other accents removed
+
+    :param text: e.g. 'Mäuse', 'Straße', 'Café'
+    :type text: str
+
+    :rtype: str
+    :return: e.g. 'maeuse', 'strasse', 'cafe'
+    """
+    return _strip_accents(unicodedata.normalize('NFC', text).casefold().translate(_UMLAUTS))
+
+
+def variants(text):
+    """
+    Keys a text is indexed under: fold() and the spelling without the umlaut dots, e.g. {'maeuse', 'mause'}
+
+    :rtype: set
+    """
+    return {fold(text), _strip_accents(unicodedata.normalize('NFC', text).casefold())}
+
+
+def trigrams(key):
+    """
+    Trigrams of a folded key, padded as pg_trgm does, e.g. 'maus' -> {'  m', ' ma', 'mau', 'aus', 'us '}
+
+    :rtype: set
+    """
+    _padded = '  ' + key + ' '
+    return {_padded[_i:_i + 3] for _i in range(len(_padded) - 2)}
+
+
+class NounIndex:
+    """
+    Prefix and trigram index of the nouns of a set of 'questions' documents, see the module docstring
+
+    :param min_similarity: trigram similarity (shared / all trigrams) a typo match needs, 0 to 1
+    :type min_similarity: float
+    """
+
+    def __init__(self, min_similarity=0.3):
+        self.min_similarity = min_similarity
+        self._terms = []          # term id -> {'Noun', 'Ans', 'Plural', 'Desc', 'quids', 'sample', 'grams'} or None
+        self._by_value = {}       # (Noun, Ans, Plural, Desc) -> term id
+        self._by_quid = {}        # quid -> term ids
+        self._prefixes = []       # sorted (key, field, term id)
+        self._grams = {}          # trigram -> term ids
+        self._free = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._by_value)
+
+    @staticmethod
+    def _values(doc):
+        """Distinct (Noun, Ans, Plural, Desc) of a 'questions' document"""
+        _values = set()
+        for _item in doc.get('data') or []:
+            if isinstance(_item, dict) and isinstance(_item.get('Noun'), str) and _item['Noun'].strip():
+                _values.add((_item['Noun'], _item.get('Ans'), _item.get('Plural'), _item.get('Desc')))
+        return _values
+
+    @staticmethod
+    def _keys(value):
+        """(key, field) prefix entries of a term"""
+        _noun, _ans, _plural, _desc = value
+        _keys = {(_key, NOUN) for _key in variants(_noun)}
+        if isinstance(_plural, str):
+            _keys.update((_key, PLURAL) for _key in variants(_plural))
+        if isinstance(_desc, str):
+            _keys.update((_word, DESC) for _word in _WORD.findall(fold(_desc)))
+        return _keys
+
+    def _add_term(self, value, entries):
+        """New term, its prefix entries are appended to entries; caller holds the lock"""
+        _grams = trigrams(fold(value[0]))
+        _term = {'Noun': value[0], 'Ans': value[1], 'Plural': value[2], 'Desc': value[3],
+                 'quids': set(), 'sample': [], 'grams': len(_grams)}
+        if self._free:
+            _id = self._free.pop()
+            self._terms[_id] = _term
+        else:
+            _id = len(self._terms)
+            self._terms.append(_term)
+        self._by_value[value] = _id
+        for _gram in _grams:
+            self._grams.setdefault(_gram, set()).add(_id)
+        entries.extend((_key, _field, _id) for _key, _field in self._keys(value))
+        return _id
+
+    def _remove_term(self, term_id):
+        """Drop a term no question refers to anymore; caller holds the lock"""
+        _term = self._terms[term_id]
+        _value = (_term['Noun'], _term['Ans'], _term['Plural'], _term['Desc'])
+        for _key, _field in self._keys(_value):
+            _entry = (_key, _field, term_id)
+            _position = bisect.bisect_left(self._prefixes, _entry)
+            if _position < len(self._prefixes) and self._prefixes[_position] == _entry:
+                del self._prefixes[_position]
+        for _gram in trigrams(fold(_term['Noun'])):
+            _ids = self._grams.get(_gram)
+            if _ids is not None:
+                _ids.discard(term_id)
+                if not _ids:
+                    del self._grams[_gram]
+        del self._by_value[_value]
+        self._terms[term_id] = None
+        self._free.append(term_id)
+
+    def _unlink(self, quid):
+        """Detach a question from its terms; caller holds the lock"""
+        for _id in self._by_quid.pop(quid, ()):
+            _term = self._terms[_id]
+            _term['quids'].discard(quid)
+            if not _term['quids']:
+                self._remove_term(_id)
+            elif quid in _term['sample']:
+                _term['sample'] = heapq.nsmallest(SAMPLE_SIZE, _term['quids'])
+
+    def add(self, documents):
+        """
+        Index 'questions' documents, a quid already indexed is replaced
+
+        :param documents: e.g. collection.find({}, {'_id': 0, 'quid': 1, 'data.Noun': 1, ...})
+        :type documents: iterable
+
+        :rtype: int
+        :return: number of documents indexed
+        """
+        # documents may be a live cursor: read it and extract the terms before taking the lock,
+        # search() only waits for the unlink and insert below
+        _documents = [(_doc['quid'], self._values(_doc)) for _doc in documents if _doc.get('quid') is not None]
+        with self._lock:
+            _entries = []
+            for _quid, _values in _documents:
+                self._unlink(_quid)
+                _ids = []
+                for _value in _values:
+                    _id = self._by_value.get(_value)
+                    if _id is None:
+                        _id = self._add_term(_value, _entries)
+                    _term = self._terms[_id]
+                    _term['quids'].add(_quid)
+                    if len(_term['sample']) < SAMPLE_SIZE:
+                        _term['sample'].append(_quid)
+                    _ids.append(_id)
+                if _ids:
+                    self._by_quid[_quid] = _ids
+
+            if len(_entries) > len(self._prefixes) // 8:
+                self._prefixes.extend(_entries)
+                self._prefixes.sort()
+            else:
+                for _entry in _entries:
+                    bisect.insort(self._prefixes, _entry)
+        return len(_documents)
+
+    def remove(self, quid):
+        """
+        Remove a question from the index
+
+        :param quid: e.g. 'QID-ba88f889-37d3-41ec-8829-d7ea2a45c61c'
+        :type quid: str
+        """
+        with self._lock:
+            self._unlink(quid)
+
+    def search(self, query, limit=10, scan_limit=2000):
+        """
+        Best terms for a (partial) noun, exact matches first, then prefixes, then similar spellings
+
+        Within a class, Noun matches come before Plural and Desc matches, then shorter keys and
+        terms used by more questions.
+
+        :param query: what was typed so far, e.g. 'mäu', 'Kalender'
+        :type query: str
+        :param limit: maximum number of results
+        :type limit: int
+        :param scan_limit: prefix entries examined at most, bounds one or two letter queries
+        :type scan_limit: int
+
+        :rtype: list
+        :return: [{'Noun': 'Maus', 'Ans': 'die', 'Plural': 'Mäuse', 'Desc': 'Mouse', 'match': 'prefix',
+                   'field': 'Noun', 'score': 1.0, 'questions': 1, 'quid': ['QID-...']}, ...]
+        """
+        _key = fold(query.strip())
+        if not _key or limit <= 0:
+            return []
+
+        _best = {}
+        with self._lock:
+            _position = bisect.bisect_left(self._prefixes, (_key,))
+            for _entry in self._prefixes[_position:_position + scan_limit]:
+                _entry_key, _field, _id = _entry
+                if not _entry_key.startswith(_key):
+                    break
+                _rank = (_CLASSES[EXACT if _entry_key == _key else PREFIX], _field, 0.0, len(_entry_key))
+                if _id not in _best or _rank < _best[_id]:
+                    _best[_id] = _rank
+
+            if len(_best) < limit and len(_key) >= 3:
+                _grams = trigrams(_key)
+                _shared = {}
+                for _gram in _grams:
+                    for _id in self._grams.get(_gram, ()):
+                        _shared[_id] = _shared.get(_id, 0) + 1
+                for _id, _count in _shared.items():
+                    if _id in _best:
+                        continue
+                    _similarity = _count / (len(_grams) + self._terms[_id]['grams'] - _count)
+                    if _similarity >= self.min_similarity:
+                        _best[_id] = (_CLASSES[SIMILAR], NOUN, -_similarity, len(self._terms[_id]['Noun']))
+
+            _top = heapq.nsmallest(limit, _best.items(),
+                                   key=lambda _x: (_x[1], -len(self._terms[_x[0]]['quids']),
+                                                   self._terms[_x[0]]['Noun']))
+            return [{'Noun': self._terms[_id]['Noun'], 'Ans': self._terms[_id]['Ans'],
+                     'Plural': self._terms[_id]['Plural'], 'Desc': self._terms[_id]['Desc'],
+                     'match': (EXACT, PREFIX, SIMILAR)[_rank[0]], 'field': _FIELDS[_rank[1]],
+                     'score': round(-_rank[2], 4) if _rank[2] else 1.0,
+                     'questions': len(self._terms[_id]['quids']), 'quid': sorted(self._terms[_id]['sample'])}
+                    for _id, _rank in _top]
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: {'terms': ..., 'questions': ..., 'prefix_entries': ..., 'trigrams': ...}
+        """
+        with self._lock:
+            return {'terms': len(self._by_value), 'questions': len(self._by_quid),
+                    'prefix_entries': len(self._prefixes), 'trigrams': len(self._grams)}
+
+
+# only what the index needs, not the quiz options
+PROJECTION = {'_id': 1, 'quid': 1, 'data.Noun': 1, 'data.Ans': 1, 'data.Plural': 1, 'data.Desc': 1}
+
+
+class NounSearch:
+    """
+    NounIndex of a worker, kept current from the 'questions' collection, see the module docstring
+
+    :param collection: returns the pymongo Collection to index, e.g. lambda: _db.questions
+    :type collection: callable
+    :param refresh_interval: seconds between background reads of newly inserted questions
+    :type refresh_interval: float
+    :param rebuild_interval: seconds between full rebuilds, which pick up edited and deleted questions
+    :type rebuild_interval: float
+    """
+
+    def __init__(self, collection, refresh_interval=10.0, rebuild_interval=600.0):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self._index = None
+        self._last_id = None
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+        self._updating = False
+        # _index, _last_id, _generation and the timestamps change under _lock; one build or refresh
+        # runs at a time, under _build_lock, whether started by a search or in the background
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._generation = 0
+        self.builds = 0
+        self.refreshes = 0
+        self.build_seconds = 0.0
+
+    def _scan(self, query, last_id):
+        """Documents of query, last_id[0] becomes the highest '_id' read, for the next refresh"""
+        for _doc in self.collection().find(query, PROJECTION).batch_size(1000):
+            _id = _doc.pop('_id', None)
+            if _id is not None and (last_id[0] is None or _id > last_id[0]):
+                last_id[0] = _id
+            yield _doc
+
+    def rebuild(self):
+        """
+        Build a new index from the whole collection and swap it in
+
+        :rtype: int
+        :return: number of questions indexed
+        """
+        with self._build_lock:
+            return self._build()[1]
+
+    def _build(self):
+        """
+        rebuild(), caller holds _build_lock; an index read before an invalidate() is not swapped in
+
+        :rtype: tuple
+        :return: (NounIndex or None when discarded, number of questions indexed)
+        """
+        _start = time.perf_counter()
+        with self._lock:
+            _generation = self._generation
+        _last_id = [None]
+        _index = NounIndex()
+        _count = _index.add(self._scan({}, _last_id))
+        with self._lock:
+            if self._generation != _generation:
+                return None, _count
+            self._index = _index
+            self._last_id = _last_id[0]
+            self._rebuilt_at = self._refreshed_at = time.monotonic()
+            self.builds += 1
+            self.build_seconds = time.perf_counter() - _start
+        return _index, _count
+
+    def refresh(self):
+        """
+        Add the questions inserted since the last build or refresh
+
+        :rtype: int
+        :return: number of questions added
+        """
+        with self._build_lock:
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+                _index = self._index
+                _last_id = [self._last_id]
+            if _index is None or _last_id[0] is None:
+                return 0
+            _count = _index.add(self._scan({'_id': {'$gt': _last_id[0]}}, _last_id))
+            with self._lock:
+                if self._index is _index:
+                    self._last_id = _last_id[0]
+                self.refreshes += 1
+            return _count
+
+    def _update(self, rebuild):
+        try:
+            self.rebuild() if rebuild else self.refresh()
+        finally:
+            with self._lock:
+                self._updating = False
+
+    def current(self):
+        """
+        The index, built on first use; an update that is due runs in the background meanwhile
+
+        :rtype: NounIndex
+        """
+        _index = self._index
+        if _index is None:
+            while _index is None:
+                with self._build_lock:
+                    # built meanwhile by another search or a background rebuild; None again after an invalidate()
+                    _index = self._index if self._index is not None else self._build()[0]
+            return _index
+
+        _now = time.monotonic()
+        _rebuild = _now - self._rebuilt_at >= self.rebuild_interval
+        if not (_rebuild or _now - self._refreshed_at >= self.refresh_interval):
+            return _index
+        with self._lock:
+            if self._updating:
+                return _index
+            self._updating = True
+        threading.Thread(target=self._update, args=(_rebuild,), name='noun-index', daemon=True).start()
+        return _index
+
+    def search(self, query, limit=10):
+        """NounIndex.search() on the current index"""
+        return self.current().search(query, limit)
+
+    def invalidate(self, quid=None):
+        """
+        Reindex one question now, e.g. after it was edited, or everything on the next search
+
+        :param quid: e.g. 'QID-ba88f889-37d3-41ec-8829-d7ea2a45c61c', None rebuilds
+        :type quid: str
+        """
+        # a build in progress may have read the question before it changed: it is not swapped in
+        with self._lock:
+            self._generation += 1
+            if quid is None:
+                self._index = None
+                self._last_id = None
+                return
+            _index = self._index
+        if _index is not None:
+            _doc = self.collection().find_one({'quid': quid}, PROJECTION)
+            if _doc is None:
+                _index.remove(quid)
+            else:
+                _doc.pop('_id', None)
+                _index.add([_doc])
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: NounIndex.stats() and {'builds': ..., 'refreshes': ..., 'build_seconds': ...}
+        """
+        _stats = self._index.stats() if self._index is not None else {}
+        _stats.update({'builds': self.builds, 'refreshes': self.refreshes,
+                       'build_seconds': round(self.build_seconds, 6)})
+        return _stats
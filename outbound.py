@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Outcome of OutboundClient.get_json(), 'source' is one of:
+# 'hit' (fresh cache), 'revalidated' (304), 'miss' (fetched), 'stale' (upstream failing), 'shared' (collapsed)
+OutboundResponse = namedtuple('OutboundResponse', ['status', 'data', 'source'])
+
+
+class UpstreamError(Exception):
+    """
+    Upstream failed, or its circuit is open, and nothing is cached to serve instead
+    """
+
+
+def parse_cache_control(value):
+    """
+    Directives of a Cache-Control header
+
+    :param value: e.g. 'public, max-age=60, s-maxage=60'
+    :type value: str
+
+    :rtype: dict
+    :return: e.g. {'public': None, 'max-age': '60', 's-maxage': '60'}
+    """
+    _directives = {}
+    for _part in (value or '').split(','):
+        _name, _, _argument = _part.strip().partition('=')
+        if _name:
+            _directives[_name.lower()] = _argument.strip('"') or None
+    return _directives
+
+
+def freshness(headers, default_ttl):
+    """
+    Seconds a response may be served from a shared cache, None if it must not be stored
+
+    :param headers: response headers
+    :param default_ttl: used when there is no max-age/s-maxage
+    :type default_ttl: float
+
+    :rtype: float
+    :return: 0 means store but revalidate on every use
+    """
+    _directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in _directives or 'private' in _directives:
+        return None
+    if 'no-cache' in _directives:
+        return 0
+    for _name in ('s-maxage', 'max-age'):
+        if _directives.get(_name, '').isdigit():
+            return float(_directives[_name])
+    return default_ttl
+
+
+def rate_limited(response):
+    """
+    True for 429, and for GitHub's 403 once the rate limit is used up (X-RateLimit-Remaining: 0)
+
+    :param response: requests.Response
+    :rtype: Boolean
+    """
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and response.headers.get('X-RateLimit-Remaining') == '0'
+
+
+class _Call:
+    """One upstream request, shared by the threads asking for the same URL"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class OutboundClient:
+    """
+    Per-worker HTTP client for upstream JSON APIs
+
+    * one pooled requests.Session per process, strict connect/read timeouts
+    * response cache honouring Cache-Control and revalidating with ETag/If-None-Match
+    * concurrent requests for the same URL share a single upstream call
+    * per-host circuit breaker, stale data is served while the upstream fails
+    """
+
+    def __init__(self, connect_timeout=2.0, read_timeout=5.0, pool_maxsize=10, failure_threshold=5,
+                 reset_timeout=30.0, max_entries=128, default_ttl=60.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._session = None
+        self._session_pid = None
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def session(self):
+        """
+        requests.Session of the current process, a session inherited through fork is not reused
+
+        :rtype: requests.Session
+        """
+        _pid = os.getpid()
+        _session = self._session
+        if _session is not None and self._session_pid == _pid:
+            return _session
+        with self._lock:
+            # concurrent first calls share the session (and its connection pool) created by one of them
+            if self._session is None or self._session_pid != _pid:
+                _session = requests.Session()
+                _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=0)
+                _session.mount('https://', _adapter)
+                _session.mount('http://', _adapter)
+                _session.headers['Accept'] = 'application/json'
+                self._session = _session
+                self._session_pid = _pid
+            return self._session
+
+    def get_json(self, url):
+        """
+        GET url and decode its JSON body
+
+        :param url: e.g. 'https://api.github.com/users/runnable'
+        :type url: str
+
+        :rtype: OutboundResponse
+        :return: (status, decoded JSON, source)
+        :raises UpstreamError: upstream failed or circuit open, and nothing cached
+        """
+        with self._lock:
+            _entry = self._cache.get(url)
+            if _entry is not None and time.monotonic() < _entry['expires']:
+                self._cache.move_to_end(url)
+                return OutboundResponse(_entry['status'], _entry['data'], 'hit')
+
+            _call = self._inflight.get(url)
+            _leader = _call is None
+            if _leader:
+                _call = self._inflight[url] = _Call()
+
+        if not _leader:
+            if not _call.event.wait(self.timeout[0] + self.timeout[1]):
+                return self._stale_or_raise(url, UpstreamError('timed out waiting for {0}'.format(url)))
+            if _call.error is not None:
+                raise _call.error
+            return _call.result._replace(source='shared' if _call.result.source == 'miss' else _call.result.source)
+
+        try:
+            _call.result = self._fetch(url, _entry)
+        except UpstreamError as _error:
+            _call.error = _error
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[url]
+            _call.event.set()
+        return _call.result
+
+    def _fetch(self, url, entry):
+        """Upstream request, revalidating entry when there is one"""
+        _host = urlsplit(url).netloc
+        if not self._allow(_host):
+            return self._stale_or_raise(url, UpstreamError('circuit open for {0}'.format(_host)))
+
+        _headers = {}
+        if entry is not None and entry['etag']:
+            _headers['If-None-Match'] = entry['etag']
+
+        try:
+            _response = self.session().get(url, headers=_headers, timeout=self.timeout)
+            if _response.status_code >= 500 or rate_limited(_response):
+                raise UpstreamError('{0} answered {1}'.format(url, _response.status_code))
+            if _response.status_code == 304 and entry is not None:
+                _ttl = freshness(_response.headers, self.default_ttl)
+                with self._lock:
+                    entry['expires'] = time.monotonic() + (_ttl or 0)
+                self._record(_host, True)
+                return OutboundResponse(entry['status'], entry['data'], 'revalidated')
+            _data = _response.json()
+        except (requests.RequestException, ValueError, UpstreamError) as _error:
+            self._record(_host, False)
+            return self._stale_or_raise(url, _error if isinstance(_error, UpstreamError) else UpstreamError(str(_error)))
+
+        self._record(_host, True)
+        _ttl = freshness(_response.headers, self.default_ttl)
+        if _response.status_code == 200 and _ttl is not None:
+            with self._lock:
+                self._cache[url] = {'status': 200, 'data': _data, 'etag': _response.headers.get('ETag'),
+                                    'expires': time.monotonic() + _ttl}
+                self._cache.move_to_end(url)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return OutboundResponse(_response.status_code, _data, 'miss')
+
+    def _stale_or_raise(self, url, error):
+        with self._lock:
+            _entry = self._cache.get(url)
+        if _entry is None:
+            raise error
+        return OutboundResponse(_entry['status'], _entry['data'], 'stale')
+
+    def _allow(self, host):
+        """Closed circuit, or open for longer than reset_timeout (half-open: one trial request)"""
+        with self._lock:
+            _circuit = self._circuits.get(host)
+            if _circuit is None or _circuit['opened'] is None:
+                return True
+            if time.monotonic() - _circuit['opened'] >= self.reset_timeout:
+                _circuit['opened'] = time.monotonic()  # next trial only after another reset_timeout
+                return True
+            return False
+
+    def _record(self, host, success):
+        with self._lock:
+            _circuit = self._circuits.setdefault(host, {'failures': 0, 'opened': None})
+            if success:
+                _circuit['failures'] = 0
+                _circuit['opened'] = None
+            else:
+                _circuit['failures'] += 1
+                if _circuit['failures'] >= self.failure_threshold:
+                    _circuit['opened'] = time.monotonic()
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: cached URLs and open circuits, e.g. {'cached': 1, 'open_circuits': ['api.github.com']}
+        """
+        with self._lock:
+            return {'cached': len(self._cache),
+                    'open_circuits': [_host for _host, _x in self._circuits.items() if _x['opened'] is not None]}
@@ -0,0 +1,382 @@
+import copy
+import hashlib
+import inspect
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Fields used to detect a changed document without refetching it, first one present wins
+VERSION_FIELDS = ('version', 'updated')
+
+
+def _freeze(value):
+    """
+    Build a hashable, order independent representation of a query or projection
+
+    :param value: query or projection, e.g. {'qzid': 'QIZ-...'} or {'_id': 0, 'data': 1}
+    :type value: dict
+
+    :rtype: str
+    :return: canonical JSON string
+    """
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def etag(body):
+    """
+    Strong entity tag of a response body
+
+    :param body: serialized document
+    :type body: bytes
+
+    :rtype: str
+    :return: hex digest, e.g. '9e107d9d372bb6826bd81d3542a419d6'
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+async def _awaited(result):
+    """Result of an asynchronous collection method, or of a synchronous one such as the snapshot's"""
+    return await result if inspect.isawaitable(result) else result
+
+
+def _is_inclusion(projection):
+    """
+    Check if projection only lists fields to return, e.g. {'_id': 0, 'data': 1}
+
+    :param projection: pymongo projection or None
+    :type projection: dict
+
+    :rtype: Boolean
+    :return: True or False
+    """
+    if not projection:
+        return False
+    return any(_value for _key, _value in projection.items() if _key != '_id')
+
+
+class QuizCache:
+    """
+    Per-worker read-through cache for 'quizzes' and 'questions' documents
+
+    Entries are keyed by (collection, query, projection), evicted least recently used
+    beyond 'maxsize', and revalidated after 'ttl' seconds. When a document carries a
+    'version' (or 'updated') field, revalidation of its 'data' only fetches that field
+    and keeps the cached copy if it is unchanged.
+    """
+
+    def __init__(self, maxsize=256, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._revisions = itertools.count(1)
+
+    @staticmethod
+    def _tag(query):
+        """Document id ('qzid' or 'quid') used for targeted invalidation"""
+        return query.get('qzid') or query.get('quid')
+
+    def find_one(self, collection, query, projection=None, revision=False):
+        """
+        Cached equivalent of collection.find_one(query, projection)
+
+        :param collection: pymongo Collection, e.g. _db.quizzes
+        :param query: filter, e.g. {'qzid': 'QIZ-3021178c-c430-4285-bed2-114dfe4db9df'}
+        :type query: dict
+        :param projection: fields to return, e.g. {'_id': 0, 'data': 1}
+        :type projection: dict
+        :param revision: also return the revision of the cached document, a number that changes
+            each time it is fetched again, None while the cache is disabled
+        :type revision: Boolean
+
+        :rtype: dict
+        :return: private copy of the document or None, (document, revision) with revision=True
+        """
+        if self.maxsize <= 0:
+            _doc = collection.find_one(query, projection)
+            return (_doc, None) if revision else _doc
+
+        return self._copy(self._lookup(collection, query, projection), revision)
+
+    def find_one_json(self, collection, query, projection, serialize):
+        """
+        Serialized find_one() and its strong ETag, both computed once per cached document
+
+        A poll of an unchanged document costs no MongoDB round-trip while the entry is fresh,
+        and only a fetch of its version field once it has expired, see find_one().
+
+        :param collection: pymongo Collection, e.g. _db.quizzes
+        :param query: filter, e.g. {'qzid': 'QIZ-3021178c-c430-4285-bed2-114dfe4db9df'}
+        :type query: dict
+        :param projection: fields to return, e.g. {'_id': 0, 'data': 1}
+        :type projection: dict
+        :param serialize: document (or None) to response body, e.g. JSON encoded bytes
+        :type serialize: callable
+
+        :rtype: tuple
+        :return: (body, ETag value without quotes)
+        """
+        if self.maxsize <= 0:
+            _body = serialize(collection.find_one(query, projection))
+            return _body, etag(_body)
+
+        return self._json(self._lookup(collection, query, projection), serialize)
+
+    async def find_one_async(self, collection, query, projection=None, revision=False):
+        """
+        find_one() reading a miss with an asynchronous client, entries are shared with find_one()
+
+        :param collection: asynchronous Collection, e.g. database.get_async_db().quizzes, or a snapshot
+            collection, whose find_one() returns the document itself
+
+        :rtype: dict
+        :return: private copy of the document or None, (document, revision) with revision=True
+        """
+        if self.maxsize <= 0:
+            _doc = await _awaited(collection.find_one(query, projection))
+            return (_doc, None) if revision else _doc
+
+        return self._copy(await self._lookup_async(collection, query, projection), revision)
+
+    @staticmethod
+    def _copy(entry, revision):
+        """Private copy of the document of an entry, with its revision when asked for"""
+        _doc = copy.deepcopy(entry['doc'])
+        return (_doc, entry['revision']) if revision else _doc
+
+    async def find_one_json_async(self, collection, query, projection, serialize):
+        """
+        find_one_json() reading a miss with an asynchronous client, see find_one_async()
+
+        :rtype: tuple
+        :return: (body, ETag value without quotes)
+        """
+        if self.maxsize <= 0:
+            _body = serialize(await _awaited(collection.find_one(query, projection)))
+            return _body, etag(_body)
+
+        return self._json(await self._lookup_async(collection, query, projection), serialize)
+
+    def _json(self, entry, serialize):
+        """(body, ETag) of a cache entry, serialized on first use"""
+        with self._lock:
+            _body = entry.get('body')
+            _etag = entry.get('etag')
+        if _body is None:
+            _body = serialize(entry['doc'])
+            _etag = etag(_body)
+            with self._lock:
+                entry['body'] = _body
+                entry['etag'] = _etag
+        return _body, _etag
+
+    def _lookup(self, collection, query, projection):
+        """
+        Fresh cache entry for (collection, query, projection), fetching or revalidating it as needed
+
+        :rtype: dict
+        :return: {'doc': ..., 'version': ..., 'tag': ..., 'expires': ..., 'revision': ...}, shared, not to be modified
+        """
+        _key, _now, _entry, _fresh = self._cached(collection, query, projection)
+        if _fresh:
+            return _entry
+
+        if _entry is not None and _entry['version'] is not None:
+            # expired, but versioned: only fetch the version field to revalidate
+            if self._revalidated(_entry, collection.find_one(query, {'_id': 0, _entry['version'][0]: 1}), _now):
+                return _entry
+
+        _fetch = self._fetch_projection(projection)
+        return self._fetched(_key, query, projection, collection.find_one(query, _fetch), _fetch, _now)
+
+    async def _lookup_async(self, collection, query, projection):
+        """_lookup() awaiting the reads of an asynchronous collection"""
+        _key, _now, _entry, _fresh = self._cached(collection, query, projection)
+        if _fresh:
+            return _entry
+
+        if _entry is not None and _entry['version'] is not None:
+            _current = await _awaited(collection.find_one(query, {'_id': 0, _entry['version'][0]: 1}))
+            if self._revalidated(_entry, _current, _now):
+                return _entry
+
+        _fetch = self._fetch_projection(projection)
+        return self._fetched(_key, query, projection, await _awaited(collection.find_one(query, _fetch)), _fetch,
+                             _now)
+
+    def _cached(self, collection, query, projection):
+        """
+        Cache entry for (collection, query, projection), counted as a hit when it is fresh
+
+        :rtype: tuple
+        :return: (key, now, entry or None, True when entry is fresh)
+        """
+        _key = (collection.name, _freeze(query), _freeze(projection))
+        _now = time.monotonic()
+
+        with self._lock:
+            _entry = self._entries.get(_key)
+            if _entry is not None:
+                self._entries.move_to_end(_key)
+                if _now < _entry['expires']:
+                    self.hits += 1
+                    return _key, _now, _entry, True
+        return _key, _now, _entry, False
+
+    def _revalidated(self, entry, current, now):
+        """Extend an expired, versioned entry when current, its version field read again, is unchanged"""
+        _field, _value = entry['version']
+        if current is None or current.get(_field) != _value:
+            return False
+        with self._lock:
+            entry['expires'] = now + self.ttl
+            self.hits += 1
+            self.revalidations += 1
+        return True
+
+    def _fetched(self, key, query, projection, doc, fetch, now):
+        """Store a document read with the _fetch_projection() fetch of projection"""
+        _doc, _version = self._strip_version(doc, projection, fetch)
+        with self._lock:
+            self.misses += 1
+            return self._store(key, query, _doc, _version, now)
+
+    def find_many(self, collection, field, values, projection=None):
+        """
+        Cached lookup of several documents by one field, missing ones are fetched with a single '$in' query
+
+        Entries are shared with find_one(collection, {field: value}, projection).
+
+        :param collection: pymongo Collection, e.g. _db.questions
+        :param field: 'qzid' or 'quid'
+        :type field: str
+        :param values: ids, e.g. ['QID-ba88f889-37d3-41ec-8829-d7ea2a45c61c', ...]
+        :type values: iterable
+        :param projection: fields to return, e.g. {'_id': 0, 'data': 1}
+        :type projection: dict
+
+        :rtype: dict
+        :return: {value: private copy of the document or None, ...}
+        """
+        _now = time.monotonic()
+        _found = {}
+        _missing = {}
+
+        with self._lock:
+            for _value in set(values):
+                _query = {field: _value}
+                _key = (collection.name, _freeze(_query), _freeze(projection))
+                _entry = self._entries.get(_key) if self.maxsize > 0 else None
+                if _entry is not None and _now < _entry['expires']:
+                    self._entries.move_to_end(_key)
+                    self.hits += 1
+                    _found[_value] = _entry['doc']
+                else:
+                    _missing[_value] = _key
+
+        if _missing:
+            _fetch = self._fetch_projection(projection)
+            if _fetch is not None and _is_inclusion(_fetch) and field not in _fetch:
+                _fetch = dict(_fetch)
+                _fetch[field] = 1
+            _docs = {_value: (None, None) for _value in _missing}
+            for _doc in collection.find({field: {'$in': list(_missing)}}, _fetch):
+                _value = _doc.get(field)
+                if projection is not None and _is_inclusion(projection) and field not in projection:
+                    _doc.pop(field, None)
+                _docs[_value] = self._strip_version(_doc, projection, _fetch)
+
+            with self._lock:
+                for _value, (_doc, _version) in _docs.items():
+                    self.misses += 1
+                    if self.maxsize > 0:
+                        self._store(_missing[_value], {field: _value}, _doc, _version, _now)
+                    _found[_value] = _doc
+
+        return {_value: copy.deepcopy(_doc) for _value, _doc in _found.items()}
+
+    @staticmethod
+    def _fetch_projection(projection):
+        """
+        Projection sent to MongoDB, those returning 'data' also return the version fields
+
+        Small metadata projections are simply refetched, so they stay covered by an index (see indexes.py).
+        """
+        if not _is_inclusion(projection) or 'data' not in projection:
+            return projection
+        _fetch = dict(projection)
+        for _field in VERSION_FIELDS:
+            _fetch.setdefault(_field, 1)
+        return _fetch
+
+    @staticmethod
+    def _strip_version(doc, projection, fetch):
+        """
+        Separate the version field from a fetched document
+
+        :rtype: tuple
+        :return: (document without unrequested version fields, (field, value) or None)
+        """
+        _version = None
+        if doc is not None:
+            for _field in VERSION_FIELDS:
+                if _field in doc:
+                    _version = (_field, doc[_field])
+                    break
+            if fetch is not projection:
+                for _field in VERSION_FIELDS:
+                    if _field not in projection:
+                        doc.pop(_field, None)
+        return doc, _version
+
+    def _store(self, key, query, doc, version, now):
+        """Insert or replace an entry and evict beyond maxsize, caller holds the lock"""
+        _entry = self._entries[key] = {'doc': doc, 'version': version, 'tag': self._tag(query),
+                                       'expires': now + self.ttl, 'revision': next(self._revisions)}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return _entry
+
+    def invalidate(self, tag=None):
+        """
+        Drop cached documents
+
+        :param tag: 'qzid' or 'quid' value, e.g. 'QIZ-3021178c-...', None drops everything
+        :type tag: str
+
+        :rtype: int
+        :return: number of entries removed
+        """
+        with self._lock:
+            if tag is None:
+                _removed = len(self._entries)
+                self._entries.clear()
+                return _removed
+
+            _keys = [_key for _key, _entry in self._entries.items() if _entry['tag'] == tag]
+            for _key in _keys:
+                del self._entries[_key]
+            return len(_keys)
+
+    def stats(self):
+        """
+        Hit/miss counters, to confirm MongoDB round-trips have left the hot path
+
+        :rtype: dict
+        :return: {'size': ..., 'maxsize': ..., 'ttl': ..., 'hits': ..., 'misses': ..., ...}
+        """
+        with self._lock:
+            _lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations,
+                    'evictions': self.evictions,
+                    'hit_ratio': round(self.hits / _lookups, 4) if _lookups else 0.0}
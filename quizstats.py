@@ -0,0 +1,289 @@
+"""
+Materialized per-quiz statistics in 'quiz_stats', kept up to date with '$inc' upserts
+
+    $ python quizstats.py rebuild                        # recompute every quiz from 'results'
+    $ python quizstats.py rebuild --qzid QIZ-3021178c-c430-4285-bed2-114dfe4db9df
+
+One document per quiz, so /api/stats/quiz/<qzid> is a single indexed read however many results exist:
+
+    {'qzid': ..., 'quid': ..., 'cif': ..., 'name': ..., 'submissions': 12, 'updated': <datetime>,
+     'scores': {'0': 1, '7': 3, ...},                                    # submissions per number correct
+     'items': {'Q01': {'Noun': 'Briefmarke', 'correct': 9, 'incorrect': 2, 'unanswered': 1,
+                       'wrong': {'der': 2}}, ...}}
+
+resultsink.py applies the increments of each written batch of results, see apply(). A batch whose
+statistics could not be written is only logged, 'rebuild' recomputes the exact figures.
+"""
+import argparse
+import datetime
+import json
+import sys
+
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo import ReplaceOne
+from pymongo import UpdateOne
+
+import config
+import indexes
+
+# rebuild() replays the results written while it runs: those with an '_id' generated up to this long
+# before it started, which covers resultsink.py batches in flight (and clock skew between workers)
+LATE_SECONDS = 60
+
+
+def _safe_key(value):
+    """Usable as a MongoDB field name: non-empty, no '.' and no leading '$'"""
+    return isinstance(value, str) and value != '' and '.' not in value and not value.startswith('$')
+
+
+def increments(result):
+    """
+    Statistics changes for one 'results' document
+
+    Wrong choices are only counted under keys that are safe field names, anything else is 'other'.
+
+    :param result: e.g. GradeResult.document()
+    :type result: dict
+
+    :rtype: tuple
+    :return: ({'submissions': 1, 'scores.7': 1, 'items.Q01.correct': 1, ...},   # $inc
+              {'items.Q01.Noun': 'Briefmarke', ...},                              # $set
+              {'quid': ..., 'cif': ..., 'name': ...})                             # $setOnInsert
+    """
+    _inc = {'submissions': 1, 'scores.{0}'.format(result.get('correct', 0)): 1}
+    _set = {}
+    for _item in result.get('items', []):
+        _label = _item.get('Label')
+        if not _safe_key(_label):
+            continue
+        _path = 'items.' + _label
+        _set[_path + '.Noun'] = _item.get('Noun')
+        _correct = _item.get('Correct')
+        if _correct == 'y':
+            _inc[_path + '.correct'] = 1
+        elif _correct == 'n':
+            _inc[_path + '.incorrect'] = 1
+            _choice = _item.get('Choice')
+            _inc['{0}.wrong.{1}'.format(_path, _choice if _safe_key(_choice) else 'other')] = 1
+        else:
+            _inc[_path + '.unanswered'] = 1
+    _set_on_insert = {_field: result.get(_field) for _field in ('quid', 'cif', 'name')}
+    return _inc, _set, _set_on_insert
+
+
+def _add(target, path, value):
+    """target[path] += value for a dotted path, as '$inc' does"""
+    _parts = path.split('.')
+    for _part in _parts[:-1]:
+        target = target.setdefault(_part, {})
+    target[_parts[-1]] = target.get(_parts[-1], 0) + value
+
+
+def _put(target, path, value):
+    """target[path] = value for a dotted path, as '$set' does"""
+    _parts = path.split('.')
+    for _part in _parts[:-1]:
+        target = target.setdefault(_part, {})
+    target[_parts[-1]] = value
+
+
+def updates(results):
+    """
+    One '$inc' upsert per quiz for a batch of results
+
+    :param results: 'results' documents
+    :type results: list
+
+    :rtype: list
+    :return: pymongo UpdateOne requests for bulk_write()
+    """
+    _merged = {}
+    for _result in results:
+        _qzid = _result.get('qzid')
+        _inc, _set, _set_on_insert = increments(_result)
+        _update = _merged.setdefault(_qzid, {'$inc': {}, '$set': {}, '$setOnInsert': _set_on_insert})
+        for _path, _value in _inc.items():
+            _update['$inc'][_path] = _update['$inc'].get(_path, 0) + _value
+        _update['$set'].update(_set)
+        if _result.get('submitted') is not None:
+            _update.setdefault('$max', {'updated': _result['submitted']})
+            _update['$max']['updated'] = max(_update['$max']['updated'], _result['submitted'])
+    return [UpdateOne({'qzid': _qzid}, {_operator: _fields for _operator, _fields in _update.items() if _fields},
+                      upsert=True)
+            for _qzid, _update in _merged.items()]
+
+
+def apply(collection, results):
+    """
+    Add a batch of results to the statistics
+
+    :param collection: pymongo Collection, e.g. _db.quiz_stats
+    :param results: 'results' documents
+    :type results: list
+    """
+    _requests = updates(results)
+    if _requests:
+        collection.bulk_write(_requests, ordered=False)
+
+
+def _statistics(qzid, results):
+    """Statistics document of one quiz, computed in memory from its results"""
+    _stats = {'qzid': qzid, 'submissions': 0, 'scores': {}, 'items': {}}
+    for _result in results:
+        _inc, _set, _set_on_insert = increments(_result)
+        for _field, _value in _set_on_insert.items():
+            _stats.setdefault(_field, _value)
+        for _path, _value in _inc.items():
+            _add(_stats, _path, _value)
+        for _path, _value in _set.items():
+            _put(_stats, _path, _value)
+        if _result.get('submitted') is not None:
+            _stats['updated'] = max(_stats.get('updated', _result['submitted']), _result['submitted'])
+    return _stats
+
+
+def _late_batches(db, query, since, seen):
+    """
+    Batches of the results written during a rebuild, until none is left
+
+    :param query: results filter of the rebuild
+    :type query: dict
+    :param since: results with an '_id' from since on are checked
+    :type since: bson.ObjectId
+    :param seen: '_id' of those already counted, the new ones are added
+    :type seen: set
+
+    :rtype: generator
+    :return: lists of 'results' documents without their '_id'
+    """
+    while True:
+        _batch = []
+        for _result in db.results.find(dict(query, _id={'$gte': since})):
+            _id = _result.pop('_id')
+            if _id not in seen:
+                seen.add(_id)
+                _batch.append(_result)
+        if not _batch:
+            return
+        yield _batch
+
+
+def rebuild(db, qzid=None, batch_size=500):
+    """
+    Recompute 'quiz_stats' from 'results', one quiz in memory at a time (results read in qzid order)
+
+    A full rebuild writes 'quiz_stats_rebuild' and renames it over 'quiz_stats', so statistics of
+    quizzes without results disappear and readers never see a partial collection.
+
+    The '$inc' of results written meanwhile go to the statistics being replaced: those results (an
+    '_id' from LATE_SECONDS before the start, not read by the scan) are replayed before the swap, until
+    none is left. Only a resultsink.py batch written during the swap itself may be counted twice or missed.
+
+    :param db: pymongo Database, e.g. client['flask']
+    :param qzid: only this quiz, e.g. 'QIZ-3021178c-c430-4285-bed2-114dfe4db9df', None for all
+    :type qzid: str
+    :param batch_size: statistics documents per bulk_write()
+
+    :rtype: dict
+    :return: {'quizzes': <statistics written>, 'results': <results read>, 'replayed': <results written meanwhile>}
+    """
+    _query = {'qzid': qzid} if qzid else {}
+    _since = ObjectId.from_datetime(datetime.datetime.now(datetime.timezone.utc)
+                                    - datetime.timedelta(seconds=LATE_SECONDS))
+    _seen = set()
+    if qzid:
+        _target = db.quiz_stats
+    else:
+        _target = db.quiz_stats_rebuild
+        _target.drop()
+        _target.create_indexes(indexes.INDEXES['quiz_stats'])
+
+    _requests = []
+    _quizzes = 0
+    _count = 0
+    _current = None
+    _pending = []
+    for _result in db.results.find(_query).sort('qzid', 1).batch_size(1000):
+        _count += 1
+        _id = _result.pop('_id', None)
+        if isinstance(_id, ObjectId) and _id >= _since:
+            _seen.add(_id)
+        if _result.get('qzid') != _current and _pending:
+            _requests.append(ReplaceOne({'qzid': _current}, _statistics(_current, _pending), upsert=True))
+            _pending = []
+        if len(_requests) >= batch_size:
+            _target.bulk_write(_requests, ordered=False)
+            _quizzes += len(_requests)
+            _requests = []
+        _current = _result.get('qzid')
+        _pending.append(_result)
+    _replayed = 0
+    if qzid:
+        # replaced in place: the results written meanwhile are added before the statistics are written
+        for _batch in _late_batches(db, _query, _since, _seen):
+            _replayed += len(_batch)
+            _current = qzid
+            _pending.extend(_batch)
+    if _pending:
+        _requests.append(ReplaceOne({'qzid': _current}, _statistics(_current, _pending), upsert=True))
+    if _requests:
+        _target.bulk_write(_requests, ordered=False)
+        _quizzes += len(_requests)
+
+    if qzid and not _count + _replayed:
+        db.quiz_stats.delete_one({'qzid': qzid})
+    elif not qzid:
+        for _batch in _late_batches(db, _query, _since, _seen):
+            _replayed += len(_batch)
+            apply(_target, _batch)
+        _target.rename('quiz_stats', dropTarget=True)
+    return {'quizzes': _quizzes, 'results': _count, 'replayed': _replayed}
+
+
+def summary(stats):
+    """
+    /api/stats/quiz/<qzid> answer for a statistics document
+
+    :param stats: 'quiz_stats' document
+    :type stats: dict
+
+    :rtype: dict
+    :return: {'qzid': ..., 'submissions': ..., 'scores': {'distribution': {...}, 'mean': ...},
+              'items': [{'Label': 'Q01', 'Noun': ..., 'accuracy': 0.75, 'common_wrong': 'der', ...}, ...]}
+    """
+    _submissions = stats.get('submissions', 0)
+    _distribution = {int(_score): _count for _score, _count in stats.get('scores', {}).items()}
+    _items = []
+    for _label, _item in sorted(stats.get('items', {}).items()):
+        _correct = _item.get('correct', 0)
+        _incorrect = _item.get('incorrect', 0)
+        _wrong = _item.get('wrong', {})
+        _items.append({'Label': _label, 'Noun': _item.get('Noun'), 'correct': _correct, 'incorrect': _incorrect,
+                       'unanswered': _item.get('unanswered', 0),
+                       'accuracy': round(_correct / (_correct + _incorrect), 4) if _correct + _incorrect else None,
+                       'common_wrong': max(_wrong, key=_wrong.get) if _wrong else None, 'wrong': _wrong})
+    return {'qzid': stats.get('qzid'), 'quid': stats.get('quid'), 'name': stats.get('name'),
+            'submissions': _submissions, 'updated': stats.get('updated'),
+            'scores': {'distribution': {str(_score): _distribution[_score] for _score in sorted(_distribution)},
+                       'mean': round(sum(_score * _count for _score, _count in _distribution.items()) / _submissions, 3)
+                       if _submissions else None},
+            'items': _items}
+
+
+def main():
+    _parser = argparse.ArgumentParser(description='rebuild the flask-play quiz statistics from the results')
+    _parser.add_argument('--uri', default=config.mongo_uri)
+    _parser.add_argument('--db', default=config.mongo_db)
+    _commands = _parser.add_subparsers(dest='command', required=True)
+    _rebuild = _commands.add_parser('rebuild', help="recompute 'quiz_stats' from 'results'")
+    _rebuild.add_argument('--qzid', help='only this quiz, e.g. QIZ-3021178c-c430-4285-bed2-114dfe4db9df')
+    _args = _parser.parse_args()
+
+    with MongoClient(_args.uri) as _client:
+        print(json.dumps(rebuild(_client[_args.db], _args.qzid), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+from pymongo.errors import PyMongoError
+
+import metrics
+
+_log = logging.getLogger(__name__)
+
+# queued by close() to stop the writer thread once everything before it is flushed
+_STOP = object()
+# write error code of a document already in the collection, e.g. inserted by an attempt that then timed out
+_DUPLICATE_KEY = 11000
+
+
+class ResultSink:
+    """
+    Write-behind sink for graded quiz results
+
+    submit() only queues the document; a background thread of the worker writes the queue with
+    insert_many() every 'batch_size' documents or 'flush_interval' seconds, whichever comes first.
+    When the queue is full, submit() waits up to 'put_timeout' seconds (backpressure on the request
+    threads) and then drops the result. close() flushes what is left, see config.worker_exit.
+
+    :param collection: returns the pymongo Collection to write to, e.g. lambda: _db.results
+    :type collection: callable
+    :param after_write: called with each list of written documents, e.g. to update quizstats.py
+    :type after_write: callable
+    """
+
+    def __init__(self, collection, maxsize=10000, batch_size=500, flush_interval=1.0, put_timeout=0.05,
+                 retries=3, after_write=None):
+        self.collection = collection
+        self.after_write = after_write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._warned = 0.0
+
+    def _running(self):
+        return self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive()
+
+    def _start(self):
+        """Writer thread of the current process, threads do not survive a fork; a dead one is replaced"""
+        if self._running():
+            return
+        with self._lock:
+            if not self._running():
+                if self._thread is not None and self._thread_pid == os.getpid():
+                    _log.warning('result sink writer thread not running, starting a new one')
+                self._thread = threading.Thread(target=self._run, name='result-sink', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, document):
+        """
+        Queue a result document for writing
+
+        :param document: e.g. GradeResult.document()
+        :type document: dict
+
+        :rtype: Boolean
+        :return: False if the queue stayed full for 'put_timeout' seconds and the result was dropped
+        """
+        self._start()
+        try:
+            self._queue.put(document, timeout=self.put_timeout)
+        except queue.Full:
+            metrics.RESULTS_DROPPED.labels('full').inc()
+            if time.monotonic() - self._warned > 10:
+                self._warned = time.monotonic()
+                _log.warning('result sink full, %d results queued, dropping results', self._queue.qsize())
+            return False
+        metrics.RESULT_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def _run(self):
+        _stopping = False
+        while not _stopping:
+            _batch = []
+            _deadline = None
+            while len(_batch) < self.batch_size:
+                _timeout = self.flush_interval if _deadline is None else _deadline - time.monotonic()
+                if _timeout <= 0:
+                    break
+                try:
+                    _document = self._queue.get(timeout=_timeout)
+                except queue.Empty:
+                    break
+                if _document is _STOP:
+                    _stopping = True
+                    break
+                _batch.append(_document)
+                if _deadline is None:
+                    _deadline = time.monotonic() + self.flush_interval
+
+            metrics.RESULT_QUEUE_DEPTH.set(self._queue.qsize())
+            if _batch:
+                try:
+                    self._flush(_batch, _stopping)
+                except Exception:
+                    # e.g. InvalidDocument: the batch is lost, not the writer thread
+                    _log.exception('result sink flush of %d results failed', len(_batch))
+                    metrics.RESULTS_DROPPED.labels('error').inc(len(_batch))
+
+    def _flush(self, batch, stopping):
+        """insert_many() a batch, retried with a short back-off while MongoDB is unavailable"""
+        for _attempt in range(1, self.retries + 1):
+            _start = time.perf_counter()
+            try:
+                self.collection().insert_many(batch, ordered=False)
+                metrics.RESULT_FLUSH_LATENCY.labels('ok').observe(time.perf_counter() - _start)
+                metrics.RESULTS_WRITTEN.inc(len(batch))
+                self._after_write(batch)
+                return
+            except BulkWriteError as _error:
+                # unordered: everything but the failed documents is written, those are not retried;
+                # insert_many() set the '_id' of each document, so on a retry a duplicate key error
+                # means the document was written by an earlier attempt
+                metrics.RESULT_FLUSH_LATENCY.labels('partial').observe(time.perf_counter() - _start)
+                _failed = {_x['index'] for _x in _error.details.get('writeErrors', [])
+                           if _attempt == 1 or _x.get('code') != _DUPLICATE_KEY}
+                metrics.RESULTS_WRITTEN.inc(len(batch) - len(_failed))
+                metrics.RESULTS_DROPPED.labels('error').inc(len(_failed))
+                self._after_write([_x for _index, _x in enumerate(batch) if _index not in _failed])
+                return
+            except PyMongoError as _error:
+                metrics.RESULT_FLUSH_LATENCY.labels('error').observe(time.perf_counter() - _start)
+                _log.warning('result sink flush of %d results failed (attempt %d): %s', len(batch), _attempt, _error)
+                if not stopping and _attempt < self.retries:
+                    time.sleep(self.flush_interval * _attempt)
+        metrics.RESULTS_DROPPED.labels('error').inc(len(batch))
+
+    def _after_write(self, documents):
+        """after_write() of written documents, a failure there does not make them count as unwritten"""
+        if self.after_write is None or not documents:
+            return
+        try:
+            self.after_write(documents)
+        except PyMongoError as _error:
+            _log.warning('result sink after_write of %d results failed: %s', len(documents), _error)
+        except Exception:
+            _log.exception('result sink after_write of %d results failed', len(documents))
+
+    def close(self, timeout=10.0):
+        """
+        Flush the queued results and stop the writer thread, called from the gunicorn worker_exit hook
+
+        :param timeout: seconds to wait for the final flush
+        :type timeout: float
+
+        :rtype: Boolean
+        :return: True if the queue was flushed in time
+        """
+        if not self._running():
+            return True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: {'queued': ..., 'maxsize': ..., 'running': True or False}
+        """
+        return {'queued': self._queue.qsize(), 'maxsize': self._queue.maxsize,
+                'running': self._running()}
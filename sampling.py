@@ -0,0 +1,172 @@
+"""
+Random quizzes drawn from a question bank, for /quiz/random?quid=...&n=20
+
+A bank's 'data' array can hold tens of thousands of nouns, so it is never fetched whole:
+
+* the bank's size (and cif, name) comes from a '$size' projection, cached per worker by BankIndex;
+* the positions to ask are drawn in Python, random.sample() of range(size);
+* only those items are returned by MongoDB, picked server-side with '$arrayElemAt'.
+
+The drawn positions and their Labels are kept in the signed session: grading fetches the same n
+items again, with 'Ans', and checks the Labels did not move meanwhile. The session is signed, not
+encrypted, so it never holds the answers.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from snapshot import supports_aggregate
+
+# quiz item fields sent to the browser, never 'Ans'
+QUIZ_FIELDS = ('Label', 'Noun', 'Opt1', 'Opt2', 'Opt3', 'Plural', 'Desc')
+# item fields needed to grade a random quiz
+GRADE_FIELDS = QUIZ_FIELDS + ('Ans',)
+
+_random = random.SystemRandom()
+
+
+def bank_pipeline(quid):
+    """
+    Aggregation returning the bank's metadata and number of items, not the items
+
+    :param quid: e.g. 'QID-05db84d8-27ac-4067-9daa-d743ff56929b'
+    :type quid: str
+
+    :rtype: list
+    :return: pipeline, answers [{'cif': ..., 'quid': ..., 'name': ..., 'size': 15}] or []
+    """
+    return [{'$match': {'quid': quid}},
+            {'$project': {'_id': 0, 'cif': 1, 'quid': 1, 'name': 1, 'size': {'$size': {'$ifNull': ['$data', []]}}}}]
+
+
+def items_pipeline(quid, positions, fields):
+    """
+    Aggregation returning the items at positions of the bank's 'data', in positions order
+
+    :param quid: e.g. 'QID-05db84d8-27ac-4067-9daa-d743ff56929b'
+    :type quid: str
+    :param positions: indexes into 'data', e.g. [3, 0, 7]
+    :type positions: list
+    :param fields: item fields to return, e.g. QUIZ_FIELDS
+    :type fields: tuple
+
+    :rtype: list
+    :return: pipeline, answers [{'data': [{'Label': 'Q04', ...}, {'Label': 'Q01', ...}, ...]}] or []
+    """
+    _projection = {'data.' + _field: 1 for _field in fields}
+    _projection['_id'] = 0
+    return [{'$match': {'quid': quid}},
+            {'$project': {'_id': 0, 'data': {'$map': {'input': list(positions), 'as': 'position',
+                                                      'in': {'$arrayElemAt': ['$data', '$$position']}}}}},
+            {'$project': _projection}]
+
+
+def bank(collection, quid):
+    """
+    Metadata and size of a question bank, see bank_pipeline()
+
+    :param collection: pymongo Collection, e.g. _db.questions
+    :param quid: e.g. 'QID-05db84d8-27ac-4067-9daa-d743ff56929b'
+    :type quid: str
+
+    :rtype: dict
+    :return: {'cif': ..., 'quid': ..., 'name': ..., 'size': ...} or None
+    """
+    if supports_aggregate(collection):
+        return next(iter(collection.aggregate(bank_pipeline(quid))), None)
+
+    # snapshot backend: the document is memory-mapped, reading it is cheap
+    _doc = collection.find_one({'quid': quid}, {'_id': 0, 'cif': 1, 'quid': 1, 'name': 1, 'data': 1})
+    if _doc is None:
+        return None
+    _doc['size'] = len(_doc.pop('data', None) or [])
+    return _doc
+
+
+def items(collection, quid, positions, fields):
+    """
+    Items at positions of a question bank, see items_pipeline()
+
+    :param collection: pymongo Collection, e.g. _db.questions
+    :param quid: e.g. 'QID-05db84d8-27ac-4067-9daa-d743ff56929b'
+    :type quid: str
+    :param positions: indexes into 'data', e.g. [3, 0, 7]
+    :type positions: list
+    :param fields: item fields to return, e.g. QUIZ_FIELDS
+    :type fields: tuple
+
+    :rtype: list
+    :return: one item per position, {} past the end of 'data'; None if there is no such bank
+    """
+    if supports_aggregate(collection):
+        _doc = next(iter(collection.aggregate(items_pipeline(quid, positions, fields))), None)
+    else:
+        _doc = collection.find_one({'quid': quid}, {'_id': 0, 'data': 1})
+        if _doc is not None:
+            _data = _doc.get('data') or []
+            _doc['data'] = [{_field: _data[_x][_field] for _field in fields if _field in _data[_x]}
+                            if 0 <= _x < len(_data) else {} for _x in positions]
+    if _doc is None:
+        return None
+    _items = _doc.get('data') or []
+    return [_item if isinstance(_item, dict) else {} for _item in _items]
+
+
+def draw(size, n):
+    """
+    n distinct positions out of size, in random order
+
+    :rtype: list
+    :return: e.g. [3, 0, 7], all positions (shuffled) when n >= size
+    """
+    return _random.sample(range(size), min(n, size))
+
+
+class BankIndex:
+    """
+    Per-worker LRU of question bank metadata and sizes by quid, refreshed after 'ttl' seconds
+    """
+
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._banks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, collection, quid):
+        """
+        Cached bank()
+
+        :rtype: dict
+        :return: {'cif': ..., 'quid': ..., 'name': ..., 'size': ...} or None
+        """
+        _now = time.monotonic()
+        with self._lock:
+            _entry = self._banks.get(quid)
+            if _entry is not None and _now < _entry[1]:
+                self._banks.move_to_end(quid)
+                return _entry[0]
+
+        _bank = bank(collection, quid)
+        if _bank is not None and self.maxsize > 0:
+            with self._lock:
+                self._banks[quid] = (_bank, _now + self.ttl)
+                self._banks.move_to_end(quid)
+                while len(self._banks) > self.maxsize:
+                    self._banks.popitem(last=False)
+        return _bank
+
+    def invalidate(self, quid=None):
+        """
+        Drop one bank, or all of them when quid is None
+
+        :rtype: int
+        :return: number of banks removed
+        """
+        with self._lock:
+            if quid is None:
+                _removed = len(self._banks)
+                self._banks.clear()
+                return _removed
+            return 1 if self._banks.pop(quid, None) is not None else 0
@@ -0,0 +1,90 @@
+"""
+Test data for MongoDB: the mongosh script tests/data/mongodb-test-data.txt and synthetic question banks
+
+Documents follow the 'questions' and 'quizzes' schema used by wsgi.py:
+
+    questions: {'cif': 'CIF-<uuid4>', 'quid': 'QID-<uuid4>', 'name': ...,
+                'data': [{'Label', 'Noun', 'Ans', 'Opt1', 'Opt2', 'Opt3', 'Plural', 'Desc'}, ...]}
+    quizzes:   {'cif': 'CIF-<uuid4>', 'quid': 'QID-<uuid4>', 'qzid': 'QIZ-<uuid4>', 'name': ...,
+                'data': [{'Label', 'Noun', 'Opt1', 'Opt2', 'Opt3', 'Plural', 'Desc'}, ...]}
+"""
+import json
+import os
+import random
+import re
+import uuid
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'data', 'mongodb-test-data.txt')
+
+# db.<collection>.insertOne({ ... }) as written in the mongosh script, the document is valid JSON
+_INSERT_ONE = re.compile(r'db\.(\w+)\.insertOne\((\{.*?\n\s*\})\)', re.DOTALL)
+
+# (Noun, Ans, Plural, Desc)
+NOUNS = [
+    ('Apfel', 'der', 'Äpfel', 'Apple'), ('Brücke', 'die', 'Brücken', 'Bridge'),
+    ('Fenster', 'das', 'Fenster', 'Window'), ('Straße', 'die', 'Straßen', 'Street'),
+    ('Mädchen', 'das', 'Mädchen', 'Girl'), ('Tisch', 'der', 'Tische', 'Table'),
+    ('Schlüssel', 'der', 'Schlüssel', 'Door Key'), ('Tür', 'die', 'Türen', 'Door'),
+    ('Buch', 'das', 'Bücher', 'Book'), ('Löffel', 'der', 'Löffel', 'Spoon'),
+    ('Gabel', 'die', 'Gabeln', 'Fork'), ('Messer', 'das', 'Messer', 'Knife'),
+    ('Stuhl', 'der', 'Stühle', 'Chair'), ('Lampe', 'die', 'Lampen', 'Lamp'),
+    ('Fahrrad', 'das', 'Fahrräder', 'Bicycle'), ('Fuß', 'der', 'Füße', 'Foot'),
+    ('Größe', 'die', 'Größen', 'Size'), ('Gemüse', 'das', 'Gemüse', 'Vegetables'),
+]
+
+
+def parse_test_data(path=TEST_DATA):
+    """
+    Documents of the insertOne() commands of a mongosh script, in file order
+
+    :param path: mongosh script, default tests/data/mongodb-test-data.txt
+    :type path: str
+
+    :rtype: generator
+    :return: (collection name, document), e.g. ('questions', {'cif': ..., 'quid': ..., ...})
+    """
+    with open(path, encoding='utf-8') as _file:
+        _script = _file.read()
+    for _collection, _document in _INSERT_ONE.findall(_script):
+        yield _collection, json.loads(_document)
+
+
+def synthetic_bank(items, rng=None, cif=None, name=None):
+    """
+    One synthetic question bank and the quiz asking all of its items
+
+    :param items: number of nouns in the bank
+    :type items: int
+    :param rng: random.Random, for reproducible banks
+    :param cif: owner, e.g. 'CIF-919ae5a5-34e4-4b88-979a-5187d46d1617', random if None
+    :type cif: str
+    :param name: question bank name, quiz name is the same with 'quiz' instead of 'question'
+    :type name: str
+
+    :rtype: tuple
+    :return: (questions document, quizzes document)
+    """
+    _rng = rng or random.Random()
+
+    def _uuid4():
+        return str(uuid.UUID(int=_rng.getrandbits(128), version=4))
+
+    _cif = cif or 'CIF-' + _uuid4()
+    _quid = 'QID-' + _uuid4()
+    _name = name or 'question-' + _quid[4:12]
+    _question = {'cif': _cif, 'quid': _quid, 'name': _name, 'data': []}
+    _quiz = {'cif': _cif, 'quid': _quid, 'qzid': 'QIZ-' + _uuid4(), 'name': _name.replace('question', 'quiz', 1),
+             'data': []}
+
+    _width = max(2, len(str(items)))
+    for _i in range(items):
+        _noun, _ans, _plural, _desc = NOUNS[_rng.randrange(len(NOUNS))]
+        if _i >= len(NOUNS):
+            _suffix = str(_i // len(NOUNS))
+            _noun, _plural, _desc = _noun + _suffix, _plural + _suffix, '{0} {1}'.format(_desc, _suffix)
+        _item = {'Label': 'Q{0:0{1}d}'.format(_i + 1, _width), 'Noun': _noun, 'Ans': _ans,
+                 'Opt1': 'der', 'Opt2': 'die', 'Opt3': 'das', 'Plural': _plural, 'Desc': _desc}
+        _question['data'].append(_item)
+        _quiz['data'].append({_key: _value for _key, _value in _item.items() if _key != 'Ans'})
+
+    return _question, _quiz
@@ -0,0 +1,159 @@
+"""
+outbound.OutboundClient against a local http.server stub
+
+    $ python -m pytest tests/test_outbound.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from outbound import OutboundClient  # noqa: E402
+from outbound import UpstreamError  # noqa: E402
+
+
+class Stub:
+    """
+    Upstream stub: replies[path] is a list of (status, headers, body or None, delay), one per request,
+    the last one repeated; requests[path] records the If-None-Match header of each request
+    """
+
+    def __init__(self):
+        self.replies = {}
+        self.requests = {}
+        _stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                _stub.requests.setdefault(self.path, []).append(self.headers.get('If-None-Match'))
+                _replies = _stub.replies[self.path]
+                _status, _headers, _body, _delay = _replies.pop(0) if len(_replies) > 1 else _replies[0]
+                time.sleep(_delay)
+                _data = json.dumps(_body).encode() if _body is not None else b''
+                try:
+                    self.send_response(_status)
+                    for _name, _value in _headers.items():
+                        self.send_header(_name, _value)
+                    self.send_header('Content-Length', str(len(_data)))
+                    self.end_headers()
+                    self.wfile.write(_data)
+                except OSError:
+                    pass  # the client timed out and closed the connection
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    _stub = Stub()
+    yield _stub
+    _stub.close()
+
+
+def test_read_timeout_raises_when_nothing_cached(stub):
+    stub.replies['/slow'] = [(200, {}, {'login': 'runnable'}, 0.5)]
+    _client = OutboundClient(connect_timeout=1.0, read_timeout=0.1)
+
+    with pytest.raises(UpstreamError):
+        _client.get_json(stub.url + '/slow')
+
+
+def test_circuit_opens_after_failure_threshold(stub):
+    stub.replies['/down'] = [(500, {}, {'message': 'boom'}, 0)]
+    _client = OutboundClient(failure_threshold=2, reset_timeout=60.0)
+
+    for _x in range(2):
+        with pytest.raises(UpstreamError):
+            _client.get_json(stub.url + '/down')
+    with pytest.raises(UpstreamError, match='circuit open'):
+        _client.get_json(stub.url + '/down')
+
+    assert len(stub.requests['/down']) == 2
+    assert _client.stats()['open_circuits'] == ['127.0.0.1:{0}'.format(stub.server.server_address[1])]
+
+
+def test_stale_served_while_upstream_fails(stub):
+    stub.replies['/user'] = [(200, {'Cache-Control': 'max-age=0'}, {'login': 'runnable'}, 0),
+                             (503, {}, {'message': 'unavailable'}, 0)]
+    _client = OutboundClient()
+
+    assert _client.get_json(stub.url + '/user') == (200, {'login': 'runnable'}, 'miss')
+    assert _client.get_json(stub.url + '/user') == (200, {'login': 'runnable'}, 'stale')
+
+
+def test_rate_limited_403_served_from_stale(stub):
+    stub.replies['/limited'] = [(200, {'Cache-Control': 'max-age=0'}, {'login': 'runnable'}, 0),
+                                (403, {'X-RateLimit-Remaining': '0'}, {'message': 'API rate limit exceeded'}, 0)]
+    _client = OutboundClient(failure_threshold=1)
+
+    assert _client.get_json(stub.url + '/limited').source == 'miss'
+    assert _client.get_json(stub.url + '/limited') == (200, {'login': 'runnable'}, 'stale')
+    assert _client.stats()['open_circuits']
+
+
+def test_concurrent_requests_coalesced(stub):
+    stub.replies['/shared'] = [(200, {'Cache-Control': 'max-age=60'}, {'login': 'runnable'}, 0.3)]
+    _client = OutboundClient()
+
+    with ThreadPoolExecutor(8) as _executor:
+        _responses = list(_executor.map(lambda _x: _client.get_json(stub.url + '/shared'), range(8)))
+
+    assert len(stub.requests['/shared']) == 1
+    assert {_response.data['login'] for _response in _responses} == {'runnable'}
+    assert sorted(_response.source for _response in _responses) == ['miss'] + ['shared'] * 7
+
+
+def test_concurrent_first_calls_share_one_session(monkeypatch):
+    _session_class = requests.Session
+    _created = []
+
+    def _slow_session():
+        # widens the window between checking for a session and storing the new one
+        time.sleep(0.05)
+        _created.append(_session_class())
+        return _created[-1]
+
+    monkeypatch.setattr(requests, 'Session', _slow_session)
+    _client = OutboundClient()
+    _barrier = threading.Barrier(8)
+
+    def _session(_x):
+        _barrier.wait()
+        return _client.session()
+
+    with ThreadPoolExecutor(8) as _executor:
+        _sessions = list(_executor.map(_session, range(8)))
+
+    assert len(_created) == 1
+    assert all(_session is _created[0] for _session in _sessions)
+
+
+def test_revalidation_with_etag(stub):
+    stub.replies['/etag'] = [(200, {'Cache-Control': 'max-age=0', 'ETag': '"v1"'}, {'login': 'runnable'}, 0),
+                             (304, {'Cache-Control': 'max-age=60', 'ETag': '"v1"'}, None, 0)]
+    _client = OutboundClient()
+
+    assert _client.get_json(stub.url + '/etag').source == 'miss'
+    assert _client.get_json(stub.url + '/etag') == (200, {'login': 'runnable'}, 'revalidated')
+    assert _client.get_json(stub.url + '/etag').source == 'hit'
+    assert stub.requests['/etag'] == [None, '"v1"']